@@ -0,0 +1,111 @@
+"""Measure the cold start cost of the event collector handlers.
+
+Every sample runs in a fresh Python process, measuring the time it takes to
+import `event_collector.handler` and the latency of the first and second
+invocation of an entry point. AWS and the HTTP APIs are mocked, so the
+numbers reflect local work only.
+
+Run with `python -m benchmarks.cold_start [samples]`.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import ENV
+
+SAMPLE = r"""
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import event_collector.handler as handler
+import_ms = (time.perf_counter() - start) * 1000
+
+import boto3
+import requests_mock
+from moto import mock_dynamodb2, mock_kinesis
+from okdata.resource_auth import ResourceAuthorizer
+from okdata.sdk.webhook.client import WebhookClient
+
+ResourceAuthorizer.has_access = lambda self, *args, **kwargs: True
+WebhookClient.authorize_webhook_token = lambda self, *args, **kwargs: {
+    "access": True,
+    "reason": None,
+}
+
+entry_point = sys.argv[1]
+event = {
+    "pathParameters": {"datasetId": "d123", "dataset_id": "d123", "version": "1"},
+    "headers": {"Authorization": "Bearer token"},
+    "queryStringParameters": {"token": "token"},
+    "body": json.dumps([{"key": i} for i in range(100)]),
+}
+
+with mock_kinesis(), mock_dynamodb2(), requests_mock.Mocker() as m:
+    m.get(
+        "https://metadata.example.org/datasets/d123",
+        json={
+            "Id": "d123",
+            "accessRights": "public",
+            "_embedded": {"versions": [{"version": "1"}]},
+        },
+    )
+    boto3.client("kinesis", region_name="eu-west-1").create_stream(
+        StreamName="dp.green.d123.incoming.1.json", ShardCount=1
+    )
+    boto3.client("dynamodb", region_name="eu-west-1").create_table(
+        TableName="event-streams",
+        KeySchema=[
+            {"AttributeName": "id", "KeyType": "HASH"},
+            {"AttributeName": "config_version", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "id", "AttributeType": "S"},
+            {"AttributeName": "config_version", "AttributeType": "N"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+    latencies = []
+    for _ in range(2):
+        start = time.perf_counter()
+        response = getattr(handler, entry_point)(event, None)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response["statusCode"] == 200, response
+
+print(json.dumps({"import_ms": import_ms, "first_ms": latencies[0], "warm_ms": latencies[1]}))
+"""
+
+
+def run_sample(entry_point):
+    output = subprocess.run(
+        [sys.executable, "-c", SAMPLE, entry_point],
+        env={**os.environ, **ENV},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(samples=5):
+    print(
+        f"{'entry point':<16}{'import ms':>12}{'first call ms':>16}{'warm call ms':>15}"
+    )
+    for entry_point in ["post_events", "events_webhook"]:
+        results = [run_sample(entry_point) for _ in range(samples)]
+        medians = [
+            statistics.median(r[field] for r in results)
+            for field in ["import_ms", "first_ms", "warm_ms"]
+        ]
+        print(
+            f"{entry_point:<16}{medians[0]:12.1f}{medians[1]:16.1f}{medians[2]:15.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
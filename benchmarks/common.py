@@ -0,0 +1,21 @@
+import os
+
+# Environment needed to import `event_collector.handler` outside of Lambda
+ENV = {
+    "AWS_ACCESS_KEY_ID": "mock",
+    "AWS_SECRET_ACCESS_KEY": "mock",
+    "AWS_DEFAULT_REGION": "eu-west-1",
+    "AWS_XRAY_SDK_ENABLED": "false",
+    "METADATA_API_URL": "https://metadata.example.org",
+    "KEYCLOAK_SERVER": "https://keycloak.example.org",
+    "KEYCLOAK_REALM": "mock",
+    "RESOURCE_SERVER_CLIENT_ID": "resource-server",
+    "OKDATA_CLIENT_ID": "mock",
+    "OKDATA_CLIENT_SECRET": "mock",
+    "SERVICE_NAME": "event-collector",
+}
+
+
+def setup_env():
+    for key, value in ENV.items():
+        os.environ.setdefault(key, value)
@@ -0,0 +1,55 @@
+"""Measure compression ratio and CPU cost of compressing Kinesis records.
+
+Run with `python -m benchmarks.compression`.
+"""
+
+import time
+
+from benchmarks.json_codec import PAYLOADS
+from event_collector import codec, compression
+from event_collector.batching import aggregate_payloads
+
+RECORD_SIZES = {
+    "per event": 0,
+    "25 KiB records": 25 * 1024,
+    "1 MiB records": 1024 * 1024,
+}
+
+
+def measure(payloads, compression_codec, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compressed = [compression.compress(p, compression_codec) for p in payloads]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return sum(len(c) for c in compressed), best
+
+
+def main():
+    print(
+        f"{'payload':<22}{'records':<16}{'codec':<7}{'ratio':>8}"
+        f"{'CPU ms':>10}{'KiB saved/CPU ms':>18}"
+    )
+    for name, events in PAYLOADS.items():
+        lines = [f"{codec.dumps(e)}\n" for e in events]
+        for record_name, record_size in RECORD_SIZES.items():
+            payloads = (
+                list(aggregate_payloads(lines, record_size)) if record_size else lines
+            )
+            original_bytes = sum(len(p.encode()) for p in payloads)
+            for compression_codec in ["gzip", "zstd"]:
+                if not compression.available(compression_codec):
+                    continue
+                compressed_bytes, seconds = measure(payloads, compression_codec)
+                ratio = original_bytes / compressed_bytes
+                saved_kib = (original_bytes - compressed_bytes) / 1024
+                cpu_ms = seconds * 1000
+                print(
+                    f"{name:<22}{record_name:<16}{compression_codec:<7}{ratio:8.2f}"
+                    f"{cpu_ms:10.2f}{saved_kib / cpu_ms:18.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Microbenchmarks for the ingestion hot path.
+
+Every step of the path from request body to Kinesis is measured for a range
+of batch sizes and event payload sizes, reporting throughput, latency
+percentiles and peak memory. Kinesis is mocked with moto.
+
+Run with `python -m benchmarks.hot_path`. Results can be saved with
+`--output results.json` and compared to an earlier run with
+`--compare baseline.json`, which exits with a non-zero status when a case got
+slower (by median latency) than the allowed `--threshold`.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import setup_env
+
+setup_env()
+
+import boto3  # noqa: E402
+from moto import mock_kinesis  # noqa: E402
+
+import event_collector.aws_clients as aws_clients  # noqa: E402
+import event_collector.handler as handler  # noqa: E402
+from event_collector.handler_responses import failed_elements_response  # noqa: E402
+from event_collector.rate_control import RateControllerRegistry  # noqa: E402
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000]
+PAYLOAD_SIZES = [100, 1024, 10 * 1024, 100 * 1024, 500 * 1024]
+# Skip combinations with bodies larger than this; they'd never get past API
+# Gateway anyway.
+MAX_BODY_BYTES = 10 * 1024 * 1024
+STREAM_NAME = "benchmark-stream"
+
+
+def make_body(batch_size, payload_size):
+    overhead = len(json.dumps({"id": 0, "payload": ""}))
+    return json.dumps(
+        [
+            {"id": i, "payload": "x" * (payload_size - overhead)}
+            for i in range(batch_size)
+        ]
+    )
+
+
+def put_records_case(events):
+    record_list = handler.event_to_record_list(events)
+    chunks, _ = handler.chunk_records(record_list)
+    return lambda: handler.put_chunks_to_kinesis(chunks, STREAM_NAME, 0)
+
+
+def cases(batch_size, payload_size):
+    """Return a mapping from case name to a function running the case."""
+    event = {"body": make_body(batch_size, payload_size)}
+    events = handler.extract_events(event)
+    record_list = handler.event_to_record_list(events)
+    put_records_response = {
+        "FailedRecordCount": batch_size // 2,
+        "Records": [
+            {"ErrorCode": "InternalFailure"} if i % 2 else {} for i in range(batch_size)
+        ],
+    }
+    failed_record_list = record_list[1::2] or record_list
+
+    return {
+        "extract_event_body": lambda: handler.extract_event_body(event),
+        "validate_event_body": lambda: handler.validate_event_body(event),
+        "event_to_record_list": lambda: handler.event_to_record_list(events),
+        "split_failed_records": lambda: handler.split_failed_records(
+            put_records_response, record_list
+        ),
+        "failed_elements_response": lambda: failed_elements_response(
+            failed_record_list
+        ),
+        "put_chunks_to_kinesis": put_records_case(events),
+    }
+
+
+def measure(f, min_time, min_repeats=5, max_repeats=1000):
+    f()  # Warm up, e.g. connection pools and caches
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_repeats and (
+        len(latencies) < min_repeats or time.perf_counter() - start < min_time
+    ):
+        t = time.perf_counter()
+        f()
+        latencies.append(time.perf_counter() - t)
+    return latencies
+
+
+def peak_memory(f):
+    tracemalloc.start()
+    try:
+        f()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(p / 100 * (len(values) - 1)))]
+
+
+def run(batch_sizes, payload_sizes, min_time):
+    results = []
+    for batch_size in batch_sizes:
+        for payload_size in payload_sizes:
+            if batch_size * payload_size > MAX_BODY_BYTES:
+                continue
+            for name, f in cases(batch_size, payload_size).items():
+                latencies = measure(f, min_time)
+                median = statistics.median(latencies)
+                result = {
+                    "case": name,
+                    "batch_size": batch_size,
+                    "payload_size": payload_size,
+                    "events_per_second": batch_size / median,
+                    "p50_ms": median * 1000,
+                    "p95_ms": percentile(latencies, 95) * 1000,
+                    "p99_ms": percentile(latencies, 99) * 1000,
+                    "peak_memory_kib": peak_memory(f) / 1024,
+                }
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def print_header():
+    print(
+        f"{'case':<26}{'batch':>7}{'payload':>9}{'events/s':>13}"
+        f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}"
+    )
+
+
+def print_result(r):
+    print(
+        f"{r['case']:<26}{r['batch_size']:>7}{r['payload_size']:>9}"
+        f"{r['events_per_second']:>13.0f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}"
+        f"{r['p99_ms']:>10.3f}{r['peak_memory_kib']:>11.0f}"
+    )
+
+
+def compare(results, baseline, threshold):
+    """Print cases that got slower than `threshold` and return their count."""
+
+    def key(r):
+        return (r["case"], r["batch_size"], r["payload_size"])
+
+    baseline = {key(r): r for r in baseline}
+    regressions = 0
+    for r in results:
+        b = baseline.get(key(r))
+        if b is None:
+            continue
+        change = r["p50_ms"] / b["p50_ms"] - 1
+        if change > threshold:
+            regressions += 1
+            print(
+                f"REGRESSION {r['case']} batch={r['batch_size']} "
+                f"payload={r['payload_size']}: p50 {b['p50_ms']:.3f} ms -> "
+                f"{r['p50_ms']:.3f} ms ({change:+.0%})"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="save results as JSON to this file")
+    parser.add_argument("--compare", help="compare to results saved earlier")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="allowed relative p50 slowdown when comparing (default: 0.1)",
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="only run a few small cases"
+    )
+    parser.add_argument(
+        "--min-time",
+        type=float,
+        default=0.5,
+        help="min seconds to spend on each case (default: 0.5)",
+    )
+    args = parser.parse_args(argv)
+
+    batch_sizes = [1, 100, 1000] if args.quick else BATCH_SIZES
+    payload_sizes = [100, 10 * 1024] if args.quick else PAYLOAD_SIZES
+
+    with mock_kinesis():
+        aws_clients.reset()
+        boto3.client("kinesis", region_name=aws_clients.REGION).create_stream(
+            StreamName=STREAM_NAME, ShardCount=1
+        )
+        # A rate high enough to never make puts wait, so that the latencies
+        # are those of the code rather than of the rate limit.
+        handler.rate_controllers = RateControllerRegistry(
+            max_rate=10**9, max_concurrency=handler.kinesis_max_workers
+        )
+        print_header()
+        results = run(batch_sizes, payload_sizes, args.min_time)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Compare the standard library JSON module with orjson on event payloads.
+
+Run with `python -m benchmarks.json_codec`.
+"""
+
+import json
+import random
+import timeit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def sensor_event(i):
+    return {
+        "sensorId": f"sensor-{i % 100:03}",
+        "timestamp": f"2021-09-01T12:{i % 60:02}:{i % 60:02}.000Z",
+        "measurements": {
+            "temperature": round(random.uniform(-20, 30), 2),
+            "humidity": round(random.uniform(0, 100), 2),
+            "pressure": round(random.uniform(950, 1050), 1),
+        },
+        "location": {"lat": 59.91 + i / 1e5, "lon": 10.75 + i / 1e5},
+        "tags": ["outdoor", "oslo"],
+    }
+
+
+def document_event(i):
+    return {
+        "id": i,
+        "title": f"Document {i}",
+        "body": "Lorem ipsum dolor sit amet. " * 100,
+        "authors": [
+            {"name": f"Author {j}", "email": f"a{j}@example.org"} for j in range(5)
+        ],
+    }
+
+
+PAYLOADS = {
+    "1000 sensor events": [sensor_event(i) for i in range(1000)],
+    "100 document events": [document_event(i) for i in range(100)],
+}
+
+
+def bench(f, number=20):
+    return min(timeit.repeat(f, number=number, repeat=5)) / number * 1000
+
+
+def main():
+    print(f"{'payload':<22}{'operation':<26}{'stdlib ms':>12}{'orjson ms':>12}")
+    for name, events in PAYLOADS.items():
+        body = json.dumps(events)
+        body_bytes = body.encode()
+        cases = [
+            (
+                "loads (whole body)",
+                lambda: json.loads(body),
+                orjson and (lambda: orjson.loads(body_bytes)),
+            ),
+            (
+                "dumps (whole body)",
+                lambda: json.dumps(events),
+                orjson and (lambda: orjson.dumps(events)),
+            ),
+            (
+                "dumps (per element)",
+                lambda: [json.dumps(e) for e in events],
+                orjson and (lambda: [orjson.dumps(e) for e in events]),
+            ),
+        ]
+        for operation, stdlib_f, orjson_f in cases:
+            stdlib_ms = bench(stdlib_f)
+            orjson_ms = f"{bench(orjson_f):12.3f}" if orjson_f else f"{'n/a':>12}"
+            print(f"{name:<22}{operation:<26}{stdlib_ms:12.3f}{orjson_ms}")
+
+    if orjson is not None:
+        events = PAYLOADS["1000 sensor events"]
+        identical = all(json.dumps(e) == orjson.dumps(e).decode() for e in events)
+        print(f"\norjson output identical to json.dumps: {identical}")
+
+
+if __name__ == "__main__":
+    main()
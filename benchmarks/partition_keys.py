@@ -0,0 +1,37 @@
+"""Measure the cost of generating partition keys with each strategy.
+
+Run with `python -m benchmarks.partition_keys`.
+"""
+
+import timeit
+import uuid
+
+from event_collector.partitioning import partition_key_function, random_key
+
+ELEMENTS = [{"device": {"id": f"sensor-{i % 100}"}, "value": i} for i in range(10000)]
+
+
+def strategies():
+    field = partition_key_function("field", "device.id")
+    hashed = partition_key_function("hash", "device.id")
+    return {
+        "uuid4": lambda element: str(uuid.uuid4()),
+        "random": lambda element: random_key(),
+        "field": field,
+        "hash": hashed,
+    }
+
+
+def main(repeat=5):
+    print(f"{'strategy':<10}{'ns/key':>10}")
+    for name, partition_key in strategies().items():
+        seconds = min(
+            timeit.repeat(
+                lambda: [partition_key(e) for e in ELEMENTS], number=1, repeat=repeat
+            )
+        )
+        print(f"{name:<10}{seconds / len(ELEMENTS) * 1e9:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
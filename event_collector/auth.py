@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import time
+
+from event_collector import codec
+from event_collector.cache import MISSING, TTLCache
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _token_claims(token):
+    """Return the claims of the JWT `token`, or an empty dict if unreadable.
+
+    The signature is not verified here; that's up to the authorization
+    server.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = codec.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else {}
+    except (IndexError, ValueError, TypeError, AttributeError):
+        return {}
+
+
+def token_expiry(token):
+    """Return the `exp` claim of the JWT `token`, or `None` if it has none.
+
+    The claim is only used to bound how long decisions are cached.
+    """
+    try:
+        exp = _token_claims(token).get("exp")
+        return float(exp) if exp is not None else None
+    except (ValueError, TypeError):
+        return None
+
+
+def token_principal(token):
+    """Return an identifier of whoever the access `token` was issued to.
+
+    That's the `sub` claim when the token has one, so that it stays the same
+    as the token is refreshed, and a digest of the token otherwise. Only use
+    it for tokens that have already been authorized.
+    """
+    subject = _token_claims(token).get("sub")
+    return f"sub:{subject}" if subject else f"token:{token_digest(token)}"
+
+
+class _CachedAuthorizer:
+    """Base class for authorizers that cache their decisions."""
+
+    def __init__(self, maxsize, ttl):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Running average of the duration of an uncached check, used to
+        # estimate the time saved by cache hits.
+        self.mean_duration = 0
+        self.time_saved = 0
+
+    def _cached(self, key, authorize, ttl_for):
+        """Return the cached decision for `key`, or call `authorize` for it.
+
+        `ttl_for` is called with the new decision and returns how many
+        seconds to cache it (0 or less to not cache it at all). Exceptions
+        from `authorize` are passed on and never cached.
+        """
+        decision = self.cache.get(key)
+        if decision is not MISSING:
+            self.time_saved += self.mean_duration
+            return decision
+
+        start = time.perf_counter()
+        decision = authorize()
+        duration = time.perf_counter() - start
+        self.mean_duration += (duration - self.mean_duration) / max(
+            self.cache.misses, 1
+        )
+
+        ttl = ttl_for(decision)
+        if ttl > 0:
+            self.cache.set(key, decision, ttl=ttl)
+        return decision
+
+    def stats(self):
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            "hits": self.cache.hits,
+            "hit_ratio": self.cache.hits / lookups if lookups else 0,
+            "time_saved": self.time_saved,
+        }
+
+
+class CachedResourceAuthorizer(_CachedAuthorizer):
+    """Caching wrapper around `okdata.resource_auth.ResourceAuthorizer`.
+
+    Positive decisions are cached for `ttl` seconds and negative ones for
+    `negative_ttl` seconds, but never beyond the expiry of the access token.
+    Positive decisions for tokens without a readable expiry aren't cached.
+    Tokens are only kept as digests.
+    """
+
+    def __init__(self, resource_authorizer, maxsize=1024, ttl=300, negative_ttl=10):
+        super().__init__(maxsize, ttl)
+        self.resource_authorizer = resource_authorizer
+        self.negative_ttl = negative_ttl
+
+    def has_access(self, access_token, scope, resource_name):
+        def ttl_for(has_access):
+            ttl = self.cache.ttl if has_access else self.negative_ttl
+            expiry = token_expiry(access_token)
+            if expiry is not None:
+                return min(ttl, expiry - time.time())
+            return 0 if has_access else ttl
+
+        return self._cached(
+            (token_digest(access_token), scope, resource_name),
+            lambda: self.resource_authorizer.has_access(
+                access_token, scope=scope, resource_name=resource_name
+            ),
+            ttl_for,
+        )
+
+
+class CachedWebhookAuthorizer(_CachedAuthorizer):
+    """Caching wrapper around `WebhookClient.authorize_webhook_token`.
+
+    Granted and denied responses are cached for `ttl` and `negative_ttl`
+    seconds respectively; keep them short so that revoked tokens stop
+    working quickly. Failed calls raise and are never cached.
+    """
+
+    def __init__(self, webhook_client, maxsize=1024, ttl=30, negative_ttl=10):
+        super().__init__(maxsize, ttl)
+        self.webhook_client = webhook_client
+        self.negative_ttl = negative_ttl
+
+    def authorize_webhook_token(self, dataset_id, token, operation, retries=3):
+        def authorize():
+            return self.webhook_client.authorize_webhook_token(
+                dataset_id, token, operation, retries=retries
+            )
+
+        if not token:
+            return authorize()
+
+        def ttl_for(response):
+            if not isinstance(response, dict) or "access" not in response:
+                return 0
+            return self.cache.ttl if response["access"] else self.negative_ttl
+
+        return self._cached(
+            (dataset_id, token_digest(token), operation), authorize, ttl_for
+        )
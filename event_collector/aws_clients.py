@@ -0,0 +1,75 @@
+import os
+import threading
+
+import boto3
+import botocore
+from boto3.dynamodb.types import TypeDeserializer
+
+REGION = "eu-west-1"
+
+retry_config = botocore.config.Config(
+    connect_timeout=3,
+    read_timeout=3,
+    retries={"max_attempts": 3, "mode": "standard"},
+    # botocore keeps pooled connections alive between requests, so size the
+    # pool to cover the threads that may share a client at the same time.
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 50)),
+)
+
+_session = None
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session(region_name=REGION)
+        return _session
+
+
+def get_client(service_name):
+    """Return a shared boto3 client for `service_name`.
+
+    Clients are created once per container and reused across invocations,
+    which saves loading the service model and setting up new connections on
+    every request. boto3 clients are thread safe.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = session.client(service_name, config=retry_config)
+                _clients[service_name] = client
+    return client
+
+
+def set_client(service_name, client):
+    """Replace the shared client for `service_name`, e.g. in tests."""
+    with _lock:
+        _clients[service_name] = client
+
+
+def reset():
+    """Drop all shared sessions and clients.
+
+    Mainly meant for tests, so that clients are recreated inside a mocked AWS
+    environment.
+    """
+    global _session
+
+    with _lock:
+        _session = None
+        _clients.clear()
+
+
+_deserializer = TypeDeserializer()
+
+
+def deserialize_item(item):
+    """Turn a DynamoDB item from a low-level client into plain Python values."""
+    return {key: _deserializer.deserialize(value) for key, value in item.items()}
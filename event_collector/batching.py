@@ -0,0 +1,93 @@
+# Kinesis PutRecords limits, see
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecords.html
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+MAX_PARTITION_KEY_BYTES = 256
+
+
+def _byte_length(value):
+    if isinstance(value, str):
+        return len(value) if value.isascii() else len(value.encode("utf-8"))
+    return len(value)
+
+
+def record_size(record):
+    """Return the size of `record` as counted by Kinesis.
+
+    Both the data blob and the partition key count towards the limits.
+    """
+    return _byte_length(record["Data"]) + _byte_length(record["PartitionKey"])
+
+
+def chunk_records(
+    record_list,
+    max_records=MAX_RECORDS_PER_REQUEST,
+    max_bytes=MAX_BYTES_PER_REQUEST,
+    max_record_bytes=MAX_BYTES_PER_RECORD,
+    distinct_keys=False,
+):
+    """Split `record_list` into chunks that each fit in one PutRecords call.
+
+    Return a tuple `(chunks, oversized_records)`, where `oversized_records` are
+    the records that are too large to ever be accepted by Kinesis. The order
+    of the records is kept within and across the chunks. With `distinct_keys`,
+    a new chunk is started whenever a partition key repeats, since PutRecords
+    doesn't keep the order of the records within a call.
+    """
+    chunks = []
+    oversized_records = []
+    chunk = []
+    chunk_bytes = 0
+    chunk_keys = set()
+
+    for record in record_list:
+        size = record_size(record)
+        if size > max_record_bytes:
+            oversized_records.append(record)
+            continue
+
+        if chunk and (
+            len(chunk) >= max_records
+            or chunk_bytes + size > max_bytes
+            or (distinct_keys and record["PartitionKey"] in chunk_keys)
+        ):
+            chunks.append(chunk)
+            chunk = []
+            chunk_bytes = 0
+            chunk_keys = set()
+
+        chunk.append(record)
+        chunk_bytes += size
+        if distinct_keys:
+            chunk_keys.add(record["PartitionKey"])
+
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks, oversized_records
+
+
+def aggregate_payloads(payloads, max_bytes):
+    """Pack newline-delimited `payloads` together into larger payloads.
+
+    Consecutive payloads are concatenated as long as the result stays within
+    `max_bytes` (capped so that a record with the largest partition key still
+    fits in Kinesis). A payload that is larger than that on its own is
+    yielded by itself.
+    """
+    max_bytes = min(max_bytes, MAX_BYTES_PER_RECORD - MAX_PARTITION_KEY_BYTES)
+    parts = []
+    size = 0
+
+    for payload in payloads:
+        payload_size = _byte_length(payload)
+        if parts and size + payload_size > max_bytes:
+            yield "".join(parts)
+            parts = []
+            size = 0
+        parts.append(payload)
+        size += payload_size
+
+    if parts:
+        yield "".join(parts)
@@ -0,0 +1,125 @@
+"""Decoding of request bodies.
+
+API Gateway hands binary bodies to Lambda base64 encoded (`isBase64Encoded`),
+and clients may compress the body (`Content-Encoding: gzip` or `deflate`) to
+save upload time. Both are decoded incrementally, and decompression stops as
+soon as the output grows beyond the configured limit, which protects against
+compression bombs.
+"""
+
+import base64
+import zlib
+
+# Base64 input is decoded in chunks of this many characters (a multiple of 4)
+CHUNK_SIZE = 256 * 1024
+
+
+class BodyDecodeError(Exception):
+    pass
+
+
+class UnsupportedEncodingError(BodyDecodeError):
+    pass
+
+
+class BodyTooLargeError(BodyDecodeError):
+    pass
+
+
+def header(event, name):
+    """Return the value of the HTTP header `name` (lower case) in `event`."""
+    headers = event.get("headers") or {}
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _base64_chunks(body):
+    for i in range(0, len(body), CHUNK_SIZE):
+        try:
+            yield base64.b64decode(body[i : i + CHUNK_SIZE], validate=True)
+        except ValueError as e:
+            raise BodyDecodeError("Invalid base64 body") from e
+
+
+def _decompressor(content_encoding, first_chunk):
+    if content_encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # "deflate" is supposed to be zlib wrapped, but some clients send raw
+    # deflate data.
+    zlib_wrapped = (
+        len(first_chunk) >= 2
+        and first_chunk[0] & 0x0F == 8
+        and int.from_bytes(first_chunk[:2], "big") % 31 == 0
+    )
+    return zlib.decompressobj(zlib.MAX_WBITS if zlib_wrapped else -zlib.MAX_WBITS)
+
+
+def _decompress(chunks, content_encoding, max_bytes):
+    decompressor = None
+    output = []
+    size = 0
+
+    try:
+        for chunk in chunks:
+            if decompressor is None:
+                decompressor = _decompressor(content_encoding, chunk)
+            while chunk:
+                data = decompressor.decompress(chunk, max_bytes - size + 1)
+                size += len(data)
+                if size > max_bytes:
+                    raise BodyTooLargeError(f"Body is larger than {max_bytes} bytes")
+                output.append(data)
+                chunk = decompressor.unconsumed_tail
+        if decompressor is not None:
+            data = decompressor.flush()
+            size += len(data)
+            if size > max_bytes:
+                raise BodyTooLargeError(f"Body is larger than {max_bytes} bytes")
+            output.append(data)
+            if not decompressor.eof:
+                raise BodyDecodeError("Truncated compressed body")
+    except zlib.error as e:
+        raise BodyDecodeError("Invalid compressed body") from e
+
+    return b"".join(output)
+
+
+def decode_body(event, max_bytes):
+    """Return the body of the Lambda proxy `event` as a decoded `str`.
+
+    Raise `UnsupportedEncodingError` for unknown content encodings,
+    `BodyTooLargeError` if the decoded body is larger than `max_bytes`, and
+    `BodyDecodeError` if the body can't be decoded.
+    """
+    body = event.get("body") or ""
+    content_encoding = (header(event, "content-encoding") or "identity").lower()
+    content_encoding = content_encoding.strip()
+
+    if content_encoding not in ("identity", "gzip", "x-gzip", "deflate"):
+        raise UnsupportedEncodingError(
+            f"Unsupported Content-Encoding: {content_encoding}"
+        )
+
+    if not event.get("isBase64Encoded"):
+        if content_encoding != "identity":
+            raise BodyDecodeError(
+                "Compressed bodies must be sent as application/octet-stream"
+            )
+        if len(body) > max_bytes:
+            raise BodyTooLargeError(f"Body is larger than {max_bytes} bytes")
+        return body
+
+    chunks = _base64_chunks(body)
+    if content_encoding == "identity":
+        data = b"".join(chunks)
+        if len(data) > max_bytes:
+            raise BodyTooLargeError(f"Body is larger than {max_bytes} bytes")
+    else:
+        data = _decompress(chunks, content_encoding, max_bytes)
+
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise BodyDecodeError("Body is not valid UTF-8") from e
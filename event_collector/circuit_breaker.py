@@ -0,0 +1,66 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Circuit breaker guarding calls to a flaky dependency.
+
+    The breaker opens after `failure_threshold` consecutive failures, and
+    then rejects calls for `reset_timeout` seconds. After that it's half-open
+    and lets a single trial call through: the breaker closes again if it
+    succeeds, and opens for another `reset_timeout` seconds if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == OPEN and self._reset_timeout_passed():
+                return HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Return whether a call may be made now.
+
+        Every allowed call must be followed by `record_success` or
+        `record_failure`.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._reset_timeout_passed():
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self._clock()
+            self._trial_in_progress = False
+
+    def _reset_timeout_passed(self):
+        return self._clock() - self._opened_at >= self.reset_timeout
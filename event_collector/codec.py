@@ -0,0 +1,43 @@
+"""JSON encoding and decoding used throughout the event collector.
+
+Decoding goes through orjson when it's installed, falling back to the
+standard library otherwise. Note that `event_collector.splitter` decodes the
+elements of JSON documents with the standard library regardless, so orjson
+speeds up NDJSON lines, metadata and auth responses, and spool messages.
+Encoding always uses the standard library's (C accelerated) encoder: orjson
+can't produce the same separators and ASCII escaping, and record data and
+response bodies must stay byte-for-byte the same as before for downstream
+consumers.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(s, exact=False):
+    """Decode the JSON document `s` (a `str` or `bytes`).
+
+    orjson turns integers that don't fit in 64 bits into floats (and rejects
+    those too large for a float). Pass `exact=True` when the result must match
+    the original document exactly, e.g. when echoing client data back.
+    """
+    if orjson is not None and not exact:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the standard library, e.g. about NaN
+            # and numbers too large for a float. Let the standard library have
+            # a go so that the same documents are accepted either way.
+            pass
+    return json.loads(s)
+
+
+def dumps(obj):
+    """Encode `obj` the same way as `json.dumps` with default arguments."""
+    return json.dumps(obj)
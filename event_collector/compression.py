@@ -0,0 +1,52 @@
+"""Compression of Kinesis record data.
+
+Compressed data is recognizable by the magic number at the start of both the
+gzip and the Zstandard formats, neither of which can start a JSON document.
+Consumers can therefore tell compressed and plain records apart without any
+extra metadata.
+"""
+
+import gzip
+import threading
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+_local = threading.local()
+
+
+def available(codec):
+    return codec == "gzip" or (codec == "zstd" and zstandard is not None)
+
+
+def _zstd_compressor():
+    # Compressor objects can't be shared between threads
+    if not hasattr(_local, "zstd_compressor"):
+        _local.zstd_compressor = zstandard.ZstdCompressor(level=3)
+    return _local.zstd_compressor
+
+
+def compress(data, codec):
+    """Compress the record data `data` (a `str`) using `codec`."""
+    data = data.encode("utf-8")
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if codec == "zstd" and zstandard is not None:
+        return _zstd_compressor().compress(data)
+    raise ValueError(f"Unsupported compression codec: {codec}")
+
+
+def decompress(data):
+    """Return the record data `data` as a `str`, decompressing it if needed."""
+    if isinstance(data, str):
+        return data
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    elif data.startswith(ZSTD_MAGIC):
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode("utf-8")
@@ -0,0 +1,64 @@
+import threading
+
+from event_collector.cache import MISSING, TTLCache
+
+
+def stream_options(event_stream):
+    """Return the event collector options configured on `event_stream`.
+
+    Options are optional attributes on the current config version of the
+    event stream item, and get their defaults when it has no such item.
+    """
+    event_stream = event_stream or {}
+    return {
+        # Pack events into records of up to this many bytes (0 to disable)
+        "record_aggregation_size": int(event_stream.get("record_aggregation_size", 0)),
+        # Compress record data with this codec ("gzip" or "zstd")
+        "record_compression": event_stream.get("record_compression"),
+        # How to pick partition keys, see `event_collector.partitioning`
+        "partition_key_strategy": event_stream.get("partition_key_strategy"),
+        "partition_key_field": event_stream.get("partition_key_field"),
+        # Put at most one record per partition key per PutRecords call
+        "ordered_delivery": bool(event_stream.get("ordered_delivery", False)),
+        # "async" to spool records and respond before they reach Kinesis
+        "delivery_mode": event_stream.get("delivery_mode", "sync"),
+        # Event field holding a unique ID used to drop resent events
+        "idempotency_key_field": event_stream.get("idempotency_key_field"),
+    }
+
+
+class EventStreamRegistry:
+    """In-process registry of event stream configurations.
+
+    Resolved configurations (or `None` when a dataset version has no event
+    stream) are cached per event stream ID and refreshed once their TTL runs
+    out. Loading is single-flight: when several threads miss on the same ID at
+    once, only one of them calls `load` while the others wait for its result.
+    """
+
+    def __init__(self, load, ttl=60, maxsize=1024):
+        self._load = load
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def get(self, event_stream_id):
+        event_stream = self.cache.get(event_stream_id)
+        if event_stream is not MISSING:
+            return event_stream
+
+        with self._lock_for(event_stream_id):
+            # Another thread may have loaded it while we were waiting.
+            event_stream = self.cache.get(event_stream_id)
+            if event_stream is MISSING:
+                event_stream = self._load(event_stream_id)
+                self.cache.set(event_stream_id, event_stream)
+
+        return event_stream
+
+    def clear(self):
+        self.cache.clear()
+
+    def _lock_for(self, event_stream_id):
+        with self._locks_lock:
+            return self._locks.setdefault(event_stream_id, threading.Lock())
@@ -1,165 +1,439 @@
-import json
+import functools
 import os
-import uuid
-from datetime import datetime
-from json.decoder import JSONDecodeError
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-import boto3
-import botocore
 from aws_xray_sdk.core import patch_all, xray_recorder
-from boto3.dynamodb.conditions import Key
 from botocore.client import ClientError
-from jsonschema import validate, ValidationError
+from botocore.exceptions import BotoCoreError
+from jsonschema import ValidationError
+from jsonschema.exceptions import SchemaError
 from okdata.aws.logging import logging_wrapper
-from okdata.aws.logging import log_add as _log_add
-from okdata.aws.logging import log_duration as _log_duration
-from okdata.aws.logging import log_exception as _log_exception
-from okdata.resource_auth import ResourceAuthorizer
-from okdata.sdk.config import Config
-from okdata.sdk.webhook.client import WebhookClient
 
+from event_collector import codec, compression, warmup
+from event_collector.auth import (
+    CachedResourceAuthorizer,
+    CachedWebhookAuthorizer,
+    token_digest,
+    token_principal,
+)
+from event_collector.aws_clients import deserialize_item, get_client
+from event_collector.batching import (
+    MAX_BYTES_PER_RECORD,
+    aggregate_payloads,
+    chunk_records,
+)
+from event_collector.body import (
+    BodyDecodeError,
+    BodyTooLargeError,
+    UnsupportedEncodingError,
+    decode_body,
+    header,
+)
+from event_collector.event_streams import EventStreamRegistry, stream_options
 from event_collector.handler_responses import (
+    accepted_response,
     error_response,
     not_found_response,
     failed_elements_response,
     ok_response,
+    record_payloads,
+)
+from event_collector.idempotency import (
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    check_content,
+    event_keys,
 )
+from event_collector.instrumentation import (
+    instrumented,
+    log_add,
+    log_duration,
+    log_exception,
+    log_incr,
+    submit,
+)
+from event_collector.lazy import once
 from event_collector.metadata import (
     MetadataApiClient,
     ServerErrorException,
     version_exists,
     get_confidentiality,
 )
+from event_collector.partitioning import (
+    group_by_key,
+    interleave_by_key,
+    partition_key_function,
+    random_key,
+)
+from event_collector.rate_control import RateControllerRegistry, throttled_count
+from event_collector.retry import RETRYABLE_ERROR_CODES, Deadline, backoff_delay
+from event_collector.spool import decode_message, spool_records
+from event_collector.splitter import split_events, split_lines
+from event_collector.validation import (
+    get_item_validator,
+    validate_event,
+    validate_events,
+)
+
+metadata_api_url = os.environ["METADATA_API_URL"]
+
+# Clients are created on first use, so that each entry point only pays for
+# (and imports) what it actually uses: `post_events` never needs the webhook
+# client and `events_webhook` never needs the resource authorizer.
+
+
+@once
+def get_metadata_api_client():
+    return MetadataApiClient(
+        metadata_api_url,
+        cache_size=int(os.environ.get("METADATA_CACHE_SIZE", 256)),
+        cache_ttl=int(os.environ.get("METADATA_CACHE_TTL", 300)),
+        not_found_ttl=int(os.environ.get("METADATA_CACHE_NOT_FOUND_TTL", 30)),
+        stale_ttl=int(os.environ.get("METADATA_STALE_TTL", 3600)),
+        failure_threshold=int(os.environ.get("METADATA_BREAKER_THRESHOLD", 5)),
+        reset_timeout=int(os.environ.get("METADATA_BREAKER_RESET_TIMEOUT", 30)),
+        connect_timeout=int(os.environ.get("METADATA_CONNECT_TIMEOUT_MS", 1000)) / 1000,
+        read_timeout=int(os.environ.get("METADATA_READ_TIMEOUT_MS", 3000)) / 1000,
+        pool_size=int(os.environ.get("METADATA_POOL_SIZE", 10)),
+        retries=int(os.environ.get("METADATA_RETRIES", 2)),
+    )
 
 
-post_events_request_schema = None
+@once
+def get_resource_authorizer():
+    from okdata.resource_auth import ResourceAuthorizer
 
-metadata_api_url = os.environ["METADATA_API_URL"]
-metadata_api_client = MetadataApiClient(metadata_api_url)
-resource_authorizer = ResourceAuthorizer()
+    return CachedResourceAuthorizer(
+        ResourceAuthorizer(),
+        maxsize=int(os.environ.get("AUTH_CACHE_SIZE", 1024)),
+        ttl=int(os.environ.get("AUTH_CACHE_TTL", 300)),
+        negative_ttl=int(os.environ.get("AUTH_CACHE_NEGATIVE_TTL", 10)),
+    )
 
-okdata_config = Config()
-# Ensure that the sdk will not try to cache credentials on file
-okdata_config.config["cacheCredentials"] = False
-webhook_client = WebhookClient(okdata_config)
 
-retry_config = botocore.config.Config(
-    connect_timeout=3, read_timeout=3, retries={"max_attempts": 3, "mode": "standard"}
-)
+@once
+def get_webhook_client():
+    from okdata.sdk.config import Config
+    from okdata.sdk.webhook.client import WebhookClient
 
-with open("serverless/documentation/schemas/postEventsRequest.json") as f:
-    post_events_request_schema = json.loads(f.read())
+    okdata_config = Config()
+    # Ensure that the sdk will not try to cache credentials on file
+    okdata_config.config["cacheCredentials"] = False
+    return CachedWebhookAuthorizer(
+        WebhookClient(okdata_config),
+        maxsize=int(os.environ.get("AUTH_CACHE_SIZE", 1024)),
+        ttl=int(os.environ.get("WEBHOOK_AUTH_CACHE_TTL", 30)),
+        negative_ttl=int(os.environ.get("AUTH_CACHE_NEGATIVE_TTL", 10)),
+    )
 
-patch_all()
 
+@once
+def get_idempotency_store():
+    table_name = os.environ.get("IDEMPOTENCY_TABLE")
+    return IdempotencyStore(
+        client=get_client("dynamodb") if table_name else None,
+        table_name=table_name,
+        maxsize=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", 10000)),
+        ttl=int(os.environ.get("IDEMPOTENCY_TTL", 86400)),
+    )
 
-def log_add(**kwargs):
-    print(f"Adding log fields: {kwargs}")
-    _log_add(**kwargs)
 
+@once
+def init_tracing():
+    # Patching is global and only has to happen once, before the first
+    # outgoing request.
+    patch_all()
 
-def log_duration(f, duration_field):
-    start = datetime.now()
-    print(f"Start time for {duration_field}: {start}")
-    result = _log_duration(f, duration_field)
-    end = datetime.now()
-    print(f"End time for {duration_field}: {end}")
-    return result
 
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson"}
 
-def log_exception(e):
-    print(f"Exception: {e}")
-    _log_exception(e)
+# Max size of a request body after base64 decoding and decompression
+max_body_bytes = int(os.environ.get("MAX_BODY_BYTES", 32 * 1024 * 1024))
+
+kinesis_backoff_base = int(os.environ.get("KINESIS_BACKOFF_BASE_MS", 50)) / 1000
+kinesis_backoff_cap = int(os.environ.get("KINESIS_BACKOFF_CAP_MS", 1000)) / 1000
+# Time reserved at the end of each invocation for returning a response
+deadline_margin = int(os.environ.get("DEADLINE_MARGIN_MS", 2000)) / 1000
+
+# SQS queue for streams in the async delivery mode, see `event_collector.spool`
+spool_queue_url = os.environ.get("SPOOL_QUEUE_URL")
+
+# Lookups done before events are sent run concurrently on this pool
+preflight_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PREFLIGHT_MAX_WORKERS", 8)),
+    thread_name_prefix="preflight",
+)
+
+# Chunks of a large batch are put to Kinesis concurrently on this pool. Its
+# threads are started on demand and kept around for warm invocations.
+kinesis_max_workers = int(os.environ.get("KINESIS_MAX_WORKERS", 4))
+kinesis_executor = ThreadPoolExecutor(
+    max_workers=kinesis_max_workers, thread_name_prefix="kinesis"
+)
+
+# Submission rate and chunk concurrency per stream, adapted to throttling
+rate_controllers = RateControllerRegistry(
+    max_rate=int(os.environ.get("KINESIS_MAX_RATE", 10000)),
+    min_rate=int(os.environ.get("KINESIS_MIN_RATE", 10)),
+    max_concurrency=kinesis_max_workers,
+)
 
 
 @logging_wrapper
+@instrumented
 @xray_recorder.capture("post_events")
 def post_events(event, context, retries=3):
+    if warmup.is_warmup_event(event):
+        return warm_up()
+
+    init_tracing()
 
     dataset_id, version = extract_path_parameters(event)
     log_add(dataset_id=dataset_id, version=version)
+    access_token = event["headers"]["Authorization"].split(" ")[-1]
+
+    dataset_future, access_future, stream_future = start_preflight(
+        dataset_id,
+        version,
+        lambda: log_duration(
+            lambda: get_resource_authorizer().has_access(
+                access_token,
+                scope="okdata:dataset:write",
+                resource_name=f"okdata:dataset:{dataset_id}",
+            ),
+            "resource_authorizer_has_access_duration",
+        ),
+    )
 
     try:
-        dataset = metadata_api_client.get_dataset_and_versions(dataset_id)
+        dataset = dataset_future.result()
         if not version_exists(dataset, version):
+            cancel_preflight(access_future, stream_future)
             return not_found_response(dataset_id, version)
     except ServerErrorException:
+        cancel_preflight(access_future, stream_future)
         return error_response(500, "Internal server error")
 
-    access_token = event["headers"]["Authorization"].split(" ")[-1]
-    has_access = log_duration(
-        lambda: resource_authorizer.has_access(
-            access_token,
-            scope="okdata:dataset:write",
-            resource_name=f"okdata:dataset:{dataset_id}",
-        ),
-        "resource_authorizer_has_access_duration",
+    has_access = access_future.result()
+    auth_cache_stats = get_resource_authorizer().stats()
+    log_add(
+        has_access=has_access,
+        resource_authorizer_cache_hit_ratio=auth_cache_stats["hit_ratio"],
+        resource_authorizer_time_saved=auth_cache_stats["time_saved"] * 1000,
     )
-    log_add(has_access=has_access)
     if not has_access:
+        cancel_preflight(stream_future)
         return error_response(403, "Forbidden")
 
-    event_body, validation_error_msg = validate_event_body(event)
-
-    if validation_error_msg:
-        return error_response(400, validation_error_msg)
-
-    return send_events(dataset, version, event_body, retries)
+    # Bodies are only decoded for authorized callers. The event stream lookup
+    # may still be running meanwhile.
+    events, validation_error = validate_event_body(event, dataset, version)
+    if validation_error:
+        cancel_preflight(stream_future)
+        return validation_error
+
+    deadline = Deadline.from_context(context, deadline_margin)
+    return send_events(
+        dataset,
+        version,
+        events,
+        retries,
+        deadline,
+        idempotency_key=header(event, "idempotency-key"),
+        caller=token_principal(access_token),
+    )
 
 
 @logging_wrapper
+@instrumented
 @xray_recorder.capture("events_webhook")
 def events_webhook(event, context, retries=3):
+    if warmup.is_warmup_event(event):
+        return warm_up()
+
+    init_tracing()
 
     dataset_id, version = extract_path_parameters(event)
     webhook_token = event.get("queryStringParameters", {}).get("token")
     log_add(dataset_id=dataset_id, version=version)
 
+    dataset_future, auth_future, stream_future = start_preflight(
+        dataset_id,
+        version,
+        lambda: log_duration(
+            lambda: get_webhook_client().authorize_webhook_token(
+                dataset_id, webhook_token, "write", retries=3
+            ),
+            "authorize_webhook_token_duration",
+        ),
+    )
+
     try:
-        dataset = metadata_api_client.get_dataset_and_versions(dataset_id)
+        dataset = dataset_future.result()
         if not version_exists(dataset, version):
+            cancel_preflight(auth_future, stream_future)
             return not_found_response(dataset_id, version)
     except ServerErrorException:
+        cancel_preflight(auth_future, stream_future)
         return error_response(500, "Internal server error")
 
-    webhook_auth_response = log_duration(
-        lambda: webhook_client.authorize_webhook_token(
-            dataset_id, webhook_token, "write", retries=3
-        ),
-        "authorize_webhook_token_duration",
+    webhook_auth_response = auth_future.result()
+    auth_cache_stats = get_webhook_client().stats()
+    log_add(
+        authorize_webhook_token_cache_hit_ratio=auth_cache_stats["hit_ratio"],
+        authorize_webhook_token_time_saved=auth_cache_stats["time_saved"] * 1000,
     )
-
     if not webhook_auth_response["access"]:
+        cancel_preflight(stream_future)
         return {
             "statusCode": 403,
-            "body": json.dumps({"message": webhook_auth_response["reason"]}),
+            "body": codec.dumps({"message": webhook_auth_response["reason"]}),
         }
 
-    event_body, validation_error_msg = validate_event_body(event)
+    # Bodies are only decoded for authorized callers. The event stream lookup
+    # may still be running meanwhile.
+    events, validation_error = validate_event_body(event, dataset, version)
+    if validation_error:
+        cancel_preflight(stream_future)
+        return validation_error
+
+    deadline = Deadline.from_context(context, deadline_margin)
+    return send_events(
+        dataset,
+        version,
+        events,
+        retries,
+        deadline,
+        idempotency_key=header(event, "idempotency-key"),
+        caller=f"webhook:{token_digest(webhook_token or '')}",
+    )
+
+
+def start_preflight(dataset_id, version, authorize):
+    """Start the independent lookups needed before events can be sent.
+
+    The dataset metadata, the authorization check (`authorize`) and the event
+    stream configuration are looked up concurrently. Return a future for
+    each, in that order. The event stream configuration ends up in
+    `event_stream_registry`, where `send_events` picks it up.
+    """
+    return (
+        submit(
+            preflight_executor,
+            get_metadata_api_client().get_dataset_and_versions,
+            dataset_id,
+        ),
+        submit(preflight_executor, authorize),
+        submit(preflight_executor, get_stream_options, dataset_id, version),
+    )
+
 
-    if validation_error_msg:
-        return error_response(400, validation_error_msg)
+def cancel_preflight(*futures):
+    """Cancel preflight lookups that are no longer needed.
 
-    return send_events(dataset, version, event_body, retries)
+    Lookups that have already started are left to finish in the background.
+    """
+    for future in futures:
+        future.cancel()
 
 
-def send_events(dataset, version, events, retries=3):
+def send_events(
+    dataset,
+    version,
+    events,
+    retries=3,
+    deadline=None,
+    idempotency_key=None,
+    caller=None,
+):
     log_add(num_events=len(events))
 
     confidentiality = get_confidentiality(dataset)
     stream_name = identify_stream_name(dataset["Id"], version, confidentiality)
     log_add(confidentiality=confidentiality, stream_name=stream_name)
+    options = get_stream_options(dataset["Id"], version)
+
+    keys = None
+    if options["idempotency_key_field"] or idempotency_key:
+        try:
+            events, keys = drop_duplicates(
+                dataset["Id"],
+                version,
+                events,
+                options["idempotency_key_field"],
+                idempotency_key,
+                caller,
+            )
+        except IdempotencyKeyReused:
+            log_add(idempotency_key_reused=True)
+            return error_response(
+                422, "Idempotency-Key was already used for a different request"
+            )
+        if not events:
+            return ok_response()
+
+    compression_codec = options["record_compression"]
+    if compression_codec and not compression.available(compression_codec):
+        log_add(record_compression_unavailable=compression_codec)
+        compression_codec = None
+
+    try:
+        partition_key = partition_key_function(
+            options["partition_key_strategy"], options["partition_key_field"]
+        )
+    except ValueError as e:
+        log_exception(e)
+        partition_key = None
+
+    aggregation_size = options["record_aggregation_size"]
+    if partition_key and not aggregation_size:
+        # Events sharing a key are packed into as few records as possible, so
+        # that a batch from a single device doesn't need a record per event.
+        aggregation_size = MAX_BYTES_PER_RECORD
+    ordered = partition_key is not None and options["ordered_delivery"]
 
     try:
-        record_list = event_to_record_list(events)
-        kinesis_response, failed_record_list = log_duration(
-            lambda: put_records_to_kinesis(record_list, stream_name, retries),
+        record_list = event_to_record_list(
+            events,
+            aggregation_size=aggregation_size,
+            compression_codec=compression_codec,
+            partition_key=partition_key,
+        )
+        log_add(num_records=len(record_list))
+        if partition_key:
+            # Spread every chunk over as many shards as possible
+            record_list = interleave_by_key(record_list)
+
+        if options["delivery_mode"] == "async":
+            record_list = spool(stream_name, record_list)
+            if not record_list:
+                if keys:
+                    record_idempotency_keys(events, keys, [])
+                return accepted_response()
+
+        chunks, oversized_records = chunk_records(record_list, distinct_keys=ordered)
+        log_add(kinesis_chunks=len(chunks))
+        if oversized_records:
+            log_add(oversized_records=len(oversized_records))
+
+        failed_record_list = oversized_records + log_duration(
+            lambda: put_chunks_to_kinesis(
+                chunks,
+                stream_name,
+                retries,
+                deadline,
+                ordered=ordered,
+            ),
             "kinesis_put_records_duration",
         )
     except ClientError as e:
         log_exception(e)
         return error_response(500, "Internal server error")
 
+    if keys:
+        record_idempotency_keys(events, keys, failed_record_list)
+
     if len(failed_record_list) > 0:
         log_add(failed_records=len(failed_record_list))
         return failed_elements_response(failed_record_list)
@@ -167,21 +441,154 @@ def send_events(dataset, version, events, retries=3):
     return ok_response()
 
 
+def drop_duplicates(dataset_id, version, events, key_field, idempotency_key, caller):
+    """Drop the events that have been sent before.
+
+    Return the remaining events along with their idempotency keys and content
+    hashes. Events repeating a key within the batch are dropped as well.
+    Raise `IdempotencyKeyReused` if a header key was recorded for different
+    content.
+    """
+    keys = event_keys(
+        events, f"{dataset_id}/{version}", key_field, idempotency_key, caller
+    )
+    try:
+        seen_keys = get_idempotency_store().seen([key for key, _ in keys if key])
+    except (BotoCoreError, ClientError) as e:
+        # Rather put duplicates than fail the request
+        log_exception(e)
+        seen_keys = {}
+
+    new_events = []
+    new_keys = []
+    for event, (key, content_hash) in zip(events, keys):
+        if key:
+            if key in seen_keys:
+                check_content(key, content_hash, seen_keys[key])
+                continue
+            seen_keys[key] = content_hash
+        new_events.append(event)
+        new_keys.append((key, content_hash))
+
+    log_add(duplicate_events=len(events) - len(new_events))
+    return new_events, new_keys
+
+
+def record_idempotency_keys(events, keys, failed_record_list):
+    """Record the keys of the events that aren't in `failed_record_list`."""
+    failed_payloads = {
+        payload for record in failed_record_list for payload in record_payloads(record)
+    }
+    succeeded_keys = {
+        key: content_hash
+        for (_, data), (key, content_hash) in zip(events, keys)
+        if key and data.rstrip("\n") not in failed_payloads
+    }
+    try:
+        get_idempotency_store().record(succeeded_keys)
+    except (BotoCoreError, ClientError) as e:
+        # The events are in Kinesis already, so the request must not fail
+        log_exception(e)
+
+
+def spool(stream_name, record_list):
+    """Spool `record_list` for `stream_name` for later delivery to Kinesis.
+
+    Return the records that must be put right away instead: those that
+    didn't make it to the spool, or all of them when no spool is configured.
+    """
+    if not spool_queue_url:
+        log_add(spool_unavailable=True)
+        return record_list
+
+    unspooled_records = log_duration(
+        lambda: spool_records(spool_queue_url, stream_name, record_list),
+        "spool_duration",
+    )
+    log_add(spooled_records=len(record_list) - len(unspooled_records))
+    if unspooled_records:
+        log_add(unspooled_records=len(unspooled_records))
+    return unspooled_records
+
+
+@logging_wrapper
+@instrumented
+@xray_recorder.capture("flush_spool")
+def flush_spool(event, context, retries=3):
+    """Drain a batch of spool messages from SQS into Kinesis.
+
+    Records from all messages for the same stream are put together in as few
+    PutRecords calls as possible. Messages with records that still failed
+    after retries are reported back to SQS as batch item failures, so that
+    they are delivered again later (possibly duplicating their other records).
+    """
+    init_tracing()
+
+    streams = {}
+    message_ids = {}
+    for message in event["Records"]:
+        stream_name, record_list = decode_message(message["body"])
+        streams.setdefault(stream_name, []).extend(record_list)
+        for record in record_list:
+            message_ids[id(record)] = message["messageId"]
+
+    log_add(
+        spool_messages=len(event["Records"]),
+        num_records=len(message_ids),
+        stream_names=sorted(streams),
+    )
+
+    deadline = Deadline.from_context(context, deadline_margin)
+    failed_message_ids = set()
+    for stream_name, record_list in streams.items():
+        chunks, oversized_records = chunk_records(record_list)
+        log_incr(kinesis_chunks=len(chunks))
+        try:
+            failed_record_list = oversized_records + log_duration(
+                lambda: put_chunks_to_kinesis(chunks, stream_name, retries, deadline),
+                "kinesis_put_records_duration",
+            )
+        except ClientError as e:
+            log_exception(e)
+            failed_record_list = record_list
+        log_incr(failed_records=len(failed_record_list))
+        failed_message_ids.update(message_ids[id(r)] for r in failed_record_list)
+
+    log_add(failed_spool_messages=len(failed_message_ids))
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in sorted(failed_message_ids)
+        ]
+    }
+
+
+def extract_events(event):
+    """Return the events in the body of `event` as `(element, data)` pairs."""
+    return list(split_events(decode_body(event, max_body_bytes)))
+
+
+def is_ndjson(event):
+    content_type = header(event, "content-type") or ""
+    return content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES
+
+
 def extract_event_body(event):
-    body = json.loads(event["body"])
-    if type(body) != list:
-        return [body]
-    else:
-        return body
+    return [element for element, _ in extract_events(event)]
 
 
 def get_event_stream(event_stream_id):
     table_name = "event-streams"
-    dynamodb = boto3.resource("dynamodb", region_name="eu-west-1", config=retry_config)
-    table = dynamodb.Table(table_name)
 
-    dynamodb_response = table.query(
-        IndexName="by_id", KeyConditionExpression=Key("id").eq(event_stream_id)
+    # Items are keyed on (id, config_version), so querying the table in
+    # descending order returns only the current config version. This runs on
+    # the preflight pool, so it uses the (thread safe) low-level client.
+    dynamodb_response = get_client("dynamodb").query(
+        TableName=table_name,
+        KeyConditionExpression="#id = :id",
+        ExpressionAttributeNames={"#id": "id"},
+        ExpressionAttributeValues={":id": {"S": event_stream_id}},
+        ScanIndexForward=False,
+        Limit=1,
     )
     if "Error" in dynamodb_response:
         log_add(dynamodb_error=dynamodb_response["Error"])
@@ -191,18 +598,43 @@ def get_event_stream(event_stream_id):
     event_stream_items = dynamodb_response["Items"]
 
     if event_stream_items:
-        current_item = max(event_stream_items, key=lambda item: item["config_version"])
-        return current_item
+        return deserialize_item(event_stream_items[0])
 
     return None
 
 
+event_stream_registry = EventStreamRegistry(
+    lambda event_stream_id: get_event_stream(event_stream_id),
+    ttl=int(os.environ.get("EVENT_STREAM_CACHE_TTL", 60)),
+)
+
+
+def scan_event_streams():
+    scan_kwargs = {"TableName": "event-streams"}
+    while True:
+        dynamodb_response = get_client("dynamodb").scan(**scan_kwargs)
+        for item in dynamodb_response["Items"]:
+            yield deserialize_item(item)
+        if "LastEvaluatedKey" not in dynamodb_response:
+            return
+        scan_kwargs["ExclusiveStartKey"] = dynamodb_response["LastEvaluatedKey"]
+
+
+def get_stream_options(dataset_id, version):
+    return stream_options(event_stream_registry.get(f"{dataset_id}/{version}"))
+
+
 def identify_stream_name(dataset_id, version, confidentiality):
     stage = "incoming"
     event_stream = log_duration(
-        lambda: get_event_stream(f"{dataset_id}/{version}"),
+        lambda: event_stream_registry.get(f"{dataset_id}/{version}"),
         "get_event_stream_duration",
     )
+    stats = event_stream_registry.cache.stats()
+    log_add(
+        event_stream_cache_hits=stats["hits"],
+        event_stream_cache_misses=stats["misses"],
+    )
 
     if event_stream:
         stage = "raw"
@@ -210,29 +642,154 @@ def identify_stream_name(dataset_id, version, confidentiality):
     return f"dp.{confidentiality}.{dataset_id}.{stage}.{version}.json"
 
 
-def put_records_to_kinesis(record_list, stream_name, retries):
-    kinesis_client = boto3.client(
-        "kinesis", region_name="eu-west-1", config=retry_config
-    )
-    put_records_response = kinesis_client.put_records(
-        StreamName=stream_name, Records=record_list
-    )
-    if "Error" in put_records_response:
-        log_add(kinesis_error=put_records_response["Error"])
-    response_metadata = put_records_response["ResponseMetadata"]
-    log_add(kinesis_retry_attempts=response_metadata.get("RetryAttempts"))
+def put_chunks_to_kinesis(chunks, stream_name, retries, deadline=None, ordered=False):
+    """Put every chunk to Kinesis and return all records that failed.
+
+    A single chunk is put directly from the calling thread, while larger
+    batches are spread over `kinesis_executor`.
+
+    When `ordered` is true, chunks are put one after the other, and once a
+    record has failed, the later records with the same partition key are
+    held back (and returned as failed) so that they can't overtake it.
+    Chunks must then hold at most one record per partition key.
+    """
+    if ordered:
+        failed_record_list = []
+        failed_keys = set()
+        for chunk in chunks:
+            held_back = [r for r in chunk if r["PartitionKey"] in failed_keys]
+            chunk = [r for r in chunk if r["PartitionKey"] not in failed_keys]
+            if chunk:
+                _, failed = put_records_to_kinesis(
+                    chunk, stream_name, retries, deadline
+                )
+                failed_keys.update(r["PartitionKey"] for r in failed)
+                failed_record_list.extend(failed)
+            failed_record_list.extend(held_back)
+        if failed_keys:
+            log_add(kinesis_failed_partition_keys=len(failed_keys))
+        return failed_record_list
+
+    if len(chunks) == 1:
+        return put_records_to_kinesis(chunks[0], stream_name, retries, deadline)[1]
+
+    # Submit chunks as long as fewer than the stream's current concurrency
+    # limit are in flight, which shrinks while the stream is throttled.
+    rate_controller = rate_controllers.get(stream_name)
+    pending_chunks = list(reversed(chunks))
+    in_flight = set()
+    failed_record_list = []
+    while pending_chunks or in_flight:
+        while pending_chunks and len(in_flight) < rate_controller.concurrency:
+            in_flight.add(
+                submit(
+                    kinesis_executor,
+                    put_records_to_kinesis,
+                    pending_chunks.pop(),
+                    stream_name,
+                    retries,
+                    deadline=deadline,
+                )
+            )
+        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            failed_record_list.extend(future.result()[1])
+    return failed_record_list
+
+
+def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+    """Put `record_list` to `stream_name`, retrying failed records.
 
+    Records that failed with a retryable error code are retried up to
+    `retries` times with exponential backoff, as long as there's time left
+    before `deadline`. Return the last PutRecords response and the list of
+    records that finally failed.
+
+    Calls wait for the stream's rate controller to allow them. When that
+    would take until past `deadline`, the remaining records are given up
+    on right away instead.
+    """
     # Applying retry-strategy: https://docs.aws.amazon.com/streams/latest/dev/developing-producers-with-sdk.html
-    if put_records_response["FailedRecordCount"] > 0:
-        failed_record_list = get_failed_records(put_records_response, record_list)
-        if retries > 0:
-            return put_records_to_kinesis(failed_record_list, stream_name, retries - 1)
-        else:
-            log_add(kinesis_remaining_retries=retries)
-            return put_records_response, failed_record_list
-    else:
-        log_add(kinesis_remaining_retries=retries)
-        return put_records_response, []
+    kinesis_client = get_client("kinesis")
+    rate_controller = rate_controllers.get(stream_name)
+    put_records_response = None
+    permanently_failed_records = []
+    attempt = 0
+    backoff_duration = 0
+
+    while True:
+        rate_wait = rate_controller.reserve(len(record_list))
+        if rate_wait:
+            if deadline is not None and deadline.remaining() <= rate_wait:
+                rate_controller.release(len(record_list))
+                log_add(kinesis_rate_limited=True)
+                log_incr(kinesis_attempts=attempt)
+                return put_records_response, permanently_failed_records + record_list
+            time.sleep(rate_wait)
+            log_incr(kinesis_rate_wait_duration=rate_wait * 1000)
+
+        put_records_response = kinesis_client.put_records(
+            StreamName=stream_name, Records=record_list
+        )
+        if "Error" in put_records_response:
+            log_add(kinesis_error=put_records_response["Error"])
+        response_metadata = put_records_response["ResponseMetadata"]
+        log_incr(kinesis_retry_attempts=response_metadata.get("RetryAttempts", 0))
+
+        throttled = throttled_count(put_records_response)
+        rate_controller.update(len(record_list), throttled)
+        if put_records_response["FailedRecordCount"] > 0:
+            log_incr(
+                kinesis_throttled_records=throttled,
+                kinesis_internal_failures=(
+                    put_records_response["FailedRecordCount"] - throttled
+                ),
+            )
+        log_add(
+            kinesis_rate=rate_controller.rate,
+            kinesis_concurrency=rate_controller.concurrency,
+        )
+
+        retryable_records = []
+        if put_records_response["FailedRecordCount"] > 0:
+            retryable_records, failed_records = split_failed_records(
+                put_records_response, record_list
+            )
+            permanently_failed_records.extend(failed_records)
+
+        delay = backoff_delay(attempt, kinesis_backoff_base, kinesis_backoff_cap)
+        out_of_time = deadline is not None and deadline.remaining() <= delay
+
+        if not retryable_records or attempt >= retries or out_of_time:
+            # Several chunks may be put concurrently, so sum up their stats
+            log_incr(
+                kinesis_attempts=attempt + 1,
+                kinesis_backoff_duration=backoff_duration * 1000,
+            )
+            log_add(kinesis_remaining_retries=retries - attempt)
+            if out_of_time and retryable_records:
+                log_add(kinesis_deadline_exceeded=True)
+            return put_records_response, (
+                permanently_failed_records + retryable_records
+            )
+
+        time.sleep(delay)
+        backoff_duration += delay
+        attempt += 1
+        record_list = retryable_records
+
+
+def split_failed_records(put_records_response, record_list):
+    """Return the failed records split into retryable and non-retryable ones."""
+    retryable_records = []
+    failed_records = []
+    for record, result in zip(record_list, put_records_response["Records"]):
+        error_code = result.get("ErrorCode")
+        if error_code in RETRYABLE_ERROR_CODES:
+            retryable_records.append(record)
+        elif error_code:
+            failed_records.append(record)
+    return retryable_records, failed_records
 
 
 def get_failed_records(put_records_response, record_list):
@@ -243,28 +800,114 @@ def get_failed_records(put_records_response, record_list):
     return failed_record_list
 
 
-def event_to_record_list(event_body):
+def event_to_record_list(
+    events, aggregation_size=0, compression_codec=None, partition_key=None
+):
+    """Turn `(element, data)` pairs into Kinesis records.
+
+    `partition_key` is a function returning the partition key of an element,
+    see `event_collector.partitioning`. Records get random keys without it.
+    When aggregating, only events with the same key are packed together.
+    """
     record_list = []
 
-    for element in event_body:
-        record_list.append(
-            {"Data": f"{json.dumps(element)}\n", "PartitionKey": str(uuid.uuid4())}
-        )
+    if partition_key:
+        groups = group_by_key(events, partition_key)
+    else:
+        groups = [(None, [data for _, data in events])]
+
+    for key, payloads in groups:
+        if aggregation_size:
+            payloads = aggregate_payloads(payloads, aggregation_size)
+
+        for data in payloads:
+            if compression_codec:
+                data = compression.compress(data, compression_codec)
+            record_list.append({"Data": data, "PartitionKey": key or random_key()})
 
     return record_list
 
 
-def validate_event_body(lambda_event):
+def validate_event_body(lambda_event, dataset=None, version=None):
+    """Extract and validate the events in the body of `lambda_event`.
+
+    Return a tuple `(events, error)`, where `error` is an error response
+    when the body is invalid.
+    """
     try:
-        event_body = extract_event_body(lambda_event)
-        validate(event_body, post_events_request_schema)
-        return event_body, None
-    except JSONDecodeError as e:
+        body = decode_body(lambda_event, max_body_bytes)
+        item_validator = get_dataset_item_validator(dataset, version)
+
+        if is_ndjson(lambda_event):
+            return validate_ndjson_events(body, item_validator)
+
+        events = list(split_events(body))
+        validate_events([element for element, _ in events])
+
+        if item_validator:
+            for element, _ in events:
+                item_validator.validate(element)
+
+        return events, None
+    except UnsupportedEncodingError as e:
         log_exception(e)
-        return None, "Body is not a valid JSON document"
+        return None, error_response(415, str(e))
+    except BodyTooLargeError as e:
+        log_exception(e)
+        return None, error_response(413, "Body is too large")
+    except BodyDecodeError as e:
+        log_exception(e)
+        return None, error_response(400, str(e))
+    except codec.JSONDecodeError as e:
+        log_exception(e)
+        return None, error_response(400, "Body is not a valid JSON document")
     except ValidationError as e:
         log_exception(e)
-        return None, "JSON document does not conform to the given schema"
+        return None, error_response(
+            400, "JSON document does not conform to the given schema"
+        )
+
+
+def validate_ndjson_events(body, item_validator=None):
+    """Validate the newline-delimited JSON `body` one line at a time.
+
+    Each line is turned into an `(element, data)` pair right away, reusing
+    the line itself as record data. Return a tuple `(events, error)` like
+    `validate_event_body`, reporting the first bad line by its number.
+    """
+    events = []
+
+    for line_number, line in split_lines(body):
+        try:
+            element = codec.loads(line)
+            validate_event(element)
+            if item_validator:
+                item_validator.validate(element)
+        except codec.JSONDecodeError as e:
+            log_exception(e)
+            return None, error_response(
+                400, f"Line {line_number} is not a valid JSON document"
+            )
+        except ValidationError as e:
+            log_exception(e)
+            return None, error_response(
+                400, f"Line {line_number} does not conform to the given schema"
+            )
+        events.append((element, f"{line}\n"))
+
+    return events, None
+
+
+def get_dataset_item_validator(dataset, version):
+    if not dataset:
+        return None
+    try:
+        return get_item_validator(dataset, version)
+    except SchemaError as e:
+        # A broken dataset schema shouldn't stop the events from being
+        # collected, so skip the item validation in that case.
+        log_exception(e)
+        return None
 
 
 # https://jira.oslo.kommune.no/browse/DP-692
@@ -277,3 +920,53 @@ def extract_path_parameters(lambda_event):
         dataset_id = lambda_event["pathParameters"]["datasetId"]
 
     return dataset_id, version
+
+
+# Hot datasets to preload on warm-up, as "dataset_id/version,..."
+warmup_datasets = warmup.parse_datasets(os.environ.get("WARMUP_DATASETS", ""))
+# Also preload this many of the most recently changed event streams
+warmup_recent_event_streams = int(os.environ.get("WARMUP_RECENT_EVENT_STREAMS", 0))
+warmup_timeout = int(os.environ.get("WARMUP_TIMEOUT_MS", 5000)) / 1000
+
+
+def warm_up():
+    """Build all clients and preload the caches for the hot datasets."""
+    start = time.perf_counter_ns()
+    init_tracing()
+    get_client("kinesis")
+    get_metadata_api_client()
+    get_resource_authorizer()
+    get_webhook_client()
+
+    datasets = list(warmup_datasets)
+    if warmup_recent_event_streams:
+        try:
+            datasets += warmup.recent_datasets(
+                scan_event_streams(), warmup_recent_event_streams
+            )
+        except ClientError as e:
+            log_exception(e)
+
+    def warm_up_dataset(dataset_id, version):
+        dataset = get_metadata_api_client().get_dataset_and_versions(dataset_id)
+        if version and version_exists(dataset, version):
+            event_stream_registry.get(f"{dataset_id}/{version}")
+
+    warmed_up = warmup.run(
+        [
+            functools.partial(warm_up_dataset, dataset_id, version)
+            for dataset_id, version in dict.fromkeys(datasets)
+        ],
+        preflight_executor,
+        timeout=warmup_timeout,
+    )
+    log_add(
+        warmup=True,
+        warmup_datasets=warmed_up,
+        warmup_duration=(time.perf_counter_ns() - start) / 1_000_000,
+    )
+    return ok_response()
+
+
+if os.environ.get("WARMUP_ON_INIT", "false").lower() == "true":
+    warm_up()
@@ -1,13 +1,28 @@
-import json
+from event_collector import codec, compression
+
+
+def record_payloads(record):
+    """Return the JSON lines contained in the data of `record`.
+
+    Record data is newline-delimited JSON (possibly compressed), holding one
+    or (when aggregated) more elements.
+    """
+    data = compression.decompress(record["Data"])
+    return [line for line in data.split("\n") if line]
+
+
+def record_elements(record):
+    """Return the elements contained in the data of `record`."""
+    return [codec.loads(line, exact=True) for line in record_payloads(record)]
 
 
 def failed_elements_response(failed_record_list):
-    failed_element_list = list(
-        map(lambda record: json.loads(record["Data"]), failed_record_list)
-    )
+    failed_element_list = [
+        element for record in failed_record_list for element in record_elements(record)
+    ]
     lambda_proxy_response = {
         "statusCode": 500,
-        "body": json.dumps(
+        "body": codec.dumps(
             {
                 "message": "Request failed for some elements",
                 "failedElements": failed_element_list,
@@ -18,18 +33,22 @@ def failed_elements_response(failed_record_list):
 
 
 def ok_response():
-    lambda_proxy_response = {"statusCode": 200, "body": json.dumps({"message": "Ok"})}
+    lambda_proxy_response = {"statusCode": 200, "body": codec.dumps({"message": "Ok"})}
     return lambda_proxy_response
 
 
+def accepted_response():
+    return {"statusCode": 202, "body": codec.dumps({"message": "Accepted"})}
+
+
 def error_response(status, message):
-    return {"statusCode": status, "body": json.dumps({"message": message})}
+    return {"statusCode": status, "body": codec.dumps({"message": message})}
 
 
 def not_found_response(dataset_id, dataset_version):
     return {
         "statusCode": 404,
-        "body": json.dumps(
+        "body": codec.dumps(
             {
                 "message": f"Dataset with id:{dataset_id} and version:{dataset_version} does not exist"
             }
@@ -0,0 +1,53 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (502, 503, 504)
+
+
+def create_session(pool_size=10, retries=2, backoff_factor=0.1):
+    """Return a `requests.Session` with a keep-alive connection pool.
+
+    Meant to be kept at module level (or on a long-lived client), so that
+    connections are reused across warm invocations instead of paying for a
+    new TCP and TLS handshake on every request. Idempotent requests are
+    retried with exponential backoff on connection errors and on 502, 503
+    and 504 responses; the last response is returned when retries run out.
+    `Retry-After` headers are ignored, since urllib3 would sleep for as long
+    as they say, regardless of the request timeout.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        backoff_factor=backoff_factor,
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def connection_stats(session):
+    """Return the number of connections opened and requests made by `session`.
+
+    The difference between the two is the number of requests that reused a
+    pooled connection.
+    """
+    stats = {"connections": 0, "requests": 0}
+    for adapter in set(session.adapters.values()):
+        pool_manager = getattr(adapter, "poolmanager", None)
+        if pool_manager is None:
+            continue
+        for key in pool_manager.pools.keys():
+            connection_pool = pool_manager.pools.get(key)
+            if connection_pool is not None:
+                stats["connections"] += connection_pool.num_connections
+                stats["requests"] += connection_pool.num_requests
+    return stats
@@ -0,0 +1,201 @@
+"""Duplicate suppression for events resent by clients.
+
+Events get an idempotency key either from a field in the event (the
+`idempotency_key_field` stream option) or from the `Idempotency-Key` header
+of the request together with the caller and the event's position in the
+batch. Keys of events that made it to Kinesis are recorded in an
+`IdempotencyStore`, and events with an already recorded key are acknowledged
+without being put again.
+
+Header keys are chosen by the client, so they are recorded along with a hash
+of the event's content. A header key that comes back with different content
+is a reused key rather than a retry, and `IdempotencyKeyReused` is raised for
+it instead of dropping the event.
+
+Duplicate suppression is best effort: two identical requests racing each
+other may both get their events put.
+"""
+
+import hashlib
+import time
+
+from event_collector.cache import MISSING, TTLCache
+from event_collector.instrumentation import log_incr
+from event_collector.partitioning import field_value
+from event_collector.retry import backoff_delay
+
+# Max number of keys per BatchGetItem and items per BatchWriteItem request
+MAX_KEYS_PER_BATCH_GET = 100
+MAX_ITEMS_PER_BATCH_WRITE = 25
+
+
+class IdempotencyKeyReused(Exception):
+    pass
+
+
+def event_keys(events, scope, key_field=None, idempotency_key=None, caller=None):
+    """Return the idempotency key of each of the `(element, data)` pairs.
+
+    Keys are scoped to `scope` (e.g. the dataset and version the events are
+    sent to) and hashed to a fixed length. Keys from `idempotency_key` are
+    also scoped to `caller`, so that different clients can't suppress each
+    other's events. Every key is paired with the hash of the content it must
+    come with, or `None` when any content will do (keys from `key_field`).
+    Events without a key get `(None, None)`.
+    """
+    path = key_field.split(".") if key_field else None
+    keys = []
+    for i, (element, data) in enumerate(events):
+        key = content_hash = None
+        if path:
+            value = field_value(element, path)
+            if value is not None:
+                key = _digest(f"{scope}:field:{value}")
+        if key is None and idempotency_key:
+            key = _digest(f"{scope}:header:{caller}:{idempotency_key}:{i}")
+            # Include the batch size, so that a batch reusing the key isn't
+            # taken for a retry just because it starts out the same.
+            content_hash = _digest(f"{len(events)}:" + data.rstrip("\n"))
+        keys.append((key, content_hash))
+    return keys
+
+
+def check_content(key, content_hash, recorded_hash):
+    """Raise `IdempotencyKeyReused` if `key` was recorded for other content."""
+    if content_hash and recorded_hash and content_hash != recorded_hash:
+        raise IdempotencyKeyReused(key)
+
+
+def _digest(key):
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class IdempotencyStore:
+    """Bounded store of recently seen idempotency keys.
+
+    Keys are kept in an in-process LRU cache, and in the DynamoDB table
+    `table_name` (through the low-level `client`) when one is given, so that
+    they are shared by all containers. The table is keyed on the string
+    attribute `key`, and items expire through the numeric TTL attribute
+    `expires_at`. The content hash of a key, if any, is kept in the string
+    attribute `content_hash`.
+
+    Items left unprocessed by a throttled table are retried with backoff up
+    to `max_attempts` times in all, and then given up on: unread keys count
+    as unseen, and unwritten keys are only recorded in process.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        table_name=None,
+        maxsize=10000,
+        ttl=86400,
+        max_attempts=3,
+        clock=time.time,
+        sleep=time.sleep,
+    ):
+        self.client = client
+        self.table_name = table_name
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._clock = clock
+        self._sleep = sleep
+
+    @property
+    def _has_table(self):
+        return self.client is not None and self.table_name is not None
+
+    def seen(self, keys):
+        """Return the recorded content hash of those of `keys` seen before.
+
+        Keys recorded without a content hash map to `None`.
+        """
+        seen_keys = {}
+        unknown_keys = []
+        for key in dict.fromkeys(keys):
+            content_hash = self.cache.get(key)
+            if content_hash is MISSING:
+                unknown_keys.append(key)
+            else:
+                seen_keys[key] = content_hash
+
+        if self._has_table and unknown_keys:
+            for key, content_hash in self._get_from_table(unknown_keys):
+                seen_keys[key] = content_hash
+                self.cache.set(key, content_hash)
+
+        return seen_keys
+
+    def record(self, keys):
+        """Record `keys`, a mapping of keys to their content hash, as seen."""
+        keys = list(keys.items())
+        for key, content_hash in keys:
+            self.cache.set(key, content_hash)
+
+        if self._has_table and keys:
+            expires_at = str(int(self._clock() + self.ttl))
+            for i in range(0, len(keys), MAX_ITEMS_PER_BATCH_WRITE):
+                request_items = {
+                    self.table_name: [
+                        {
+                            "PutRequest": {
+                                "Item": self._item(key, content_hash, expires_at)
+                            }
+                        }
+                        for key, content_hash in keys[i : i + MAX_ITEMS_PER_BATCH_WRITE]
+                    ]
+                }
+                for _ in self._batch_requests(
+                    self.client.batch_write_item, request_items, "UnprocessedItems"
+                ):
+                    pass
+
+    @staticmethod
+    def _item(key, content_hash, expires_at):
+        item = {"key": {"S": key}, "expires_at": {"N": expires_at}}
+        if content_hash:
+            item["content_hash"] = {"S": content_hash}
+        return item
+
+    def _get_from_table(self, keys):
+        now = self._clock()
+        for i in range(0, len(keys), MAX_KEYS_PER_BATCH_GET):
+            request_items = {
+                self.table_name: {
+                    "Keys": [
+                        {"key": {"S": key}}
+                        for key in keys[i : i + MAX_KEYS_PER_BATCH_GET]
+                    ],
+                    "ProjectionExpression": "#k, expires_at, content_hash",
+                    "ExpressionAttributeNames": {"#k": "key"},
+                }
+            }
+            for response in self._batch_requests(
+                self.client.batch_get_item, request_items, "UnprocessedKeys"
+            ):
+                for item in response["Responses"].get(self.table_name, []):
+                    # Expired items linger until DynamoDB gets around to
+                    # deleting them.
+                    if int(item["expires_at"]["N"]) > now:
+                        yield item["key"]["S"], item.get("content_hash", {}).get("S")
+
+    def _batch_requests(self, call, request_items, unprocessed_field):
+        """Call `call` until every item is processed, yielding the responses.
+
+        Unprocessed items are resent with backoff, up to `max_attempts` calls
+        in all.
+        """
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._sleep(backoff_delay(attempt - 1))
+            response = call(RequestItems=request_items)
+            yield response
+            request_items = response.get(unprocessed_field)
+            if not request_items:
+                return
+        unprocessed = request_items[self.table_name]
+        if isinstance(unprocessed, dict):
+            unprocessed = unprocessed["Keys"]
+        log_incr(idempotency_unprocessed_items=len(unprocessed))
@@ -0,0 +1,123 @@
+"""Low-overhead structured logging for the event collector.
+
+Log fields are buffered in memory during an invocation and handed over to
+`okdata.aws.logging` in one go when the invocation ends (see `instrumented`),
+which then emits them as a single structured log line. Nothing is written to
+stdout on the hot path, unless debug output is enabled for the invocation
+through `DEBUG_LOG_SAMPLE_RATE` (the fraction of invocations to print debug
+output for, 0 by default).
+
+Each invocation gets its own buffer, tracked through a context variable.
+Work handed to a thread pool must be submitted with `submit`, so that it logs
+to the buffer of the invocation that started it. Whatever such work logs
+after its invocation has ended is dropped, rather than ending up in the log
+line of a later request.
+"""
+
+import contextvars
+import functools
+import os
+import random
+import threading
+import time
+
+from okdata.aws.logging import log_add as _log_add
+from okdata.aws.logging import log_exception as _log_exception
+
+debug_sample_rate = float(os.environ.get("DEBUG_LOG_SAMPLE_RATE", 0))
+
+
+class _Invocation:
+    def __init__(self, debug=False):
+        self.fields = {}
+        self.exceptions = []
+        self.debug = debug
+        self.closed = False
+        self.lock = threading.Lock()
+
+
+_invocation = contextvars.ContextVar("invocation", default=None)
+
+
+def _update(update, debug_message):
+    invocation = _invocation.get()
+    if invocation is None:
+        return
+    with invocation.lock:
+        if invocation.closed:
+            return
+        update(invocation)
+    if invocation.debug:
+        print(debug_message)
+
+
+def log_add(**kwargs):
+    """Add (or overwrite) log fields for the current invocation."""
+    _update(lambda i: i.fields.update(kwargs), f"Adding log fields: {kwargs}")
+
+
+def log_incr(**kwargs):
+    """Add to numeric log fields, e.g. counters updated from several threads."""
+
+    def incr(invocation):
+        for key, value in kwargs.items():
+            invocation.fields[key] = invocation.fields.get(key, 0) + value
+
+    _update(incr, f"Incrementing log fields: {kwargs}")
+
+
+def log_duration(f, duration_field):
+    """Call `f` and log how long it took in milliseconds as `duration_field`."""
+    start = time.perf_counter_ns()
+    try:
+        return f()
+    finally:
+        log_add(**{duration_field: (time.perf_counter_ns() - start) / 1_000_000})
+
+
+def log_exception(e):
+    _update(lambda i: i.exceptions.append(e), f"Exception: {e}")
+
+
+def submit(executor, fn, *args, **kwargs):
+    """Submit `fn` to `executor`, logging to the current invocation."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def flush():
+    """Hand the buffered log fields over to `okdata.aws.logging`.
+
+    The current invocation's buffer is closed, so nothing more is logged to
+    it.
+    """
+    invocation = _invocation.get()
+    if invocation is None:
+        return
+    with invocation.lock:
+        invocation.closed = True
+        fields = invocation.fields
+        exceptions = invocation.exceptions
+    if fields:
+        _log_add(**fields)
+    for e in exceptions:
+        _log_exception(e)
+
+
+def instrumented(handler):
+    """Decorator buffering the log fields of each invocation of `handler`.
+
+    Must be applied inside `okdata.aws.logging.logging_wrapper`, so that the
+    fields are flushed before the log line is emitted.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(event, context, *args, **kwargs):
+        debug = debug_sample_rate > 0 and random.random() < debug_sample_rate
+        token = _invocation.set(_Invocation(debug))
+        try:
+            return handler(event, context, *args, **kwargs)
+        finally:
+            flush()
+            _invocation.reset(token)
+
+    return wrapper
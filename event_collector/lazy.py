@@ -0,0 +1,23 @@
+import functools
+import threading
+
+
+def once(f):
+    """Decorator memoizing the result of the argument-less function `f`.
+
+    `f` is called the first time the decorated function is called, and only
+    once even when several threads race for it. Useful for deferring the
+    construction of expensive objects until they're actually needed.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(f)
+    def wrapper():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(f())
+        return result[0]
+
+    return wrapper
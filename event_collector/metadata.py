@@ -1,11 +1,18 @@
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-import requests
-from okdata.aws.logging import log_add as _log_add
-from okdata.aws.logging import log_duration as _log_duration
-from okdata.aws.logging import log_exception as _log_exception
 from requests.exceptions import RequestException
-from simplejson.errors import JSONDecodeError
+
+from event_collector import codec
+from event_collector.cache import MISSING, TTLCache
+from event_collector.circuit_breaker import CLOSED, CircuitBreaker
+from event_collector.http_session import connection_stats, create_session
+from event_collector.instrumentation import (
+    log_add,
+    log_duration,
+    log_exception,
+    submit,
+)
 
 CONFIDENTIALITY_MAP = {
     "public": "green",
@@ -14,45 +21,141 @@ CONFIDENTIALITY_MAP = {
 }
 
 
-def log_add(**kwargs):
-    print(f"Adding log fields: {kwargs}")
-    _log_add(**kwargs)
-
-
-def log_duration(f, duration_field):
-    start = datetime.now()
-    print(f"Start time for {duration_field}: {start}")
-    result = _log_duration(f, duration_field)
-    end = datetime.now()
-    print(f"End time for {duration_field}: {end}")
-    return result
-
-
-def log_exception(e):
-    print(f"Exception: {e}")
-    _log_exception(e)
-
-
 class MetadataApiClient:
-    def __init__(self, metadata_api_url):
+    def __init__(
+        self,
+        metadata_api_url,
+        cache_size=256,
+        cache_ttl=300,
+        not_found_ttl=30,
+        stale_ttl=3600,
+        failure_threshold=5,
+        reset_timeout=30,
+        connect_timeout=1,
+        read_timeout=3,
+        pool_size=10,
+        retries=2,
+    ):
         self.url = metadata_api_url
+        # Kept for the lifetime of the client, so that connections to the
+        # metadata API are reused across warm invocations.
+        self.session = create_session(pool_size=pool_size, retries=retries)
+        self.timeout = (connect_timeout, read_timeout)
+        # Datasets and their versions are rarely changed, so keep them around
+        # across warm invocations. Datasets that don't exist are only
+        # remembered for a short while, so that a newly created dataset
+        # becomes available quickly.
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.not_found_ttl = not_found_ttl
+        # The last known good version of each dataset, served for up to
+        # `stale_ttl` seconds when the metadata API is unavailable.
+        self.stale_cache = TTLCache(maxsize=cache_size, ttl=stale_ttl)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="metadata-refresh"
+        )
+        self._refreshing = set()
+        self._refreshing_lock = threading.Lock()
 
     def get_dataset_and_versions(self, dataset_id):
+        dataset = self.cache.get(dataset_id)
+        cache_hit = dataset is not MISSING
+
+        if not cache_hit:
+            dataset = self._get_uncached(dataset_id)
+
+        stats = self.cache.stats()
+        log_add(
+            metadata_cache_hit=cache_hit,
+            metadata_cache_hits=stats["hits"],
+            metadata_cache_misses=stats["misses"],
+            metadata_cache_evictions=stats["evictions"],
+            metadata_circuit_state=self.breaker.state,
+        )
+        return dataset
+
+    def _get_uncached(self, dataset_id):
+        """Fetch `dataset_id`, falling back to its last known good version.
+
+        While the circuit breaker is open, the stale version is served right
+        away, and refreshed in the background if the breaker lets a trial
+        request through. Without a stale version, failures are raised as
+        `ServerErrorException`.
+        """
+        stale_dataset = self.stale_cache.get(dataset_id)
+
+        if stale_dataset is MISSING:
+            if not self.breaker.allow_request():
+                log_add(metadata_circuit_open=True)
+                raise ServerErrorException
+            return self._fetch_dataset_and_versions(dataset_id)
+
+        if self.breaker.state != CLOSED or not self.breaker.allow_request():
+            log_add(metadata_stale=True)
+            self._refresh_in_background(dataset_id)
+            return stale_dataset
+
+        try:
+            return self._fetch_dataset_and_versions(dataset_id)
+        except ServerErrorException:
+            log_add(metadata_stale=True)
+            return stale_dataset
+
+    def _refresh_in_background(self, dataset_id):
+        with self._refreshing_lock:
+            if dataset_id in self._refreshing:
+                return
+            self._refreshing.add(dataset_id)
+        submit(self._refresh_executor, self._refresh, dataset_id)
+
+    def _refresh(self, dataset_id):
+        try:
+            # Skipped while the breaker is still open; a later request for
+            # the dataset triggers another refresh.
+            if self.breaker.allow_request():
+                self._fetch_dataset_and_versions(dataset_id)
+        except ServerErrorException:
+            pass
+        finally:
+            with self._refreshing_lock:
+                self._refreshing.discard(dataset_id)
+
+    def _fetch_dataset_and_versions(self, dataset_id):
+        """Fetch `dataset_id` from the metadata API.
+
+        Must only be called when `self.breaker` allows it, since the outcome
+        is recorded on the breaker.
+        """
         dataset_url = f"{self.url}/datasets/{dataset_id}?embed=versions"
 
         try:
             response = log_duration(
-                lambda: requests.get(dataset_url),
+                lambda: self.session.get(dataset_url, timeout=self.timeout),
                 "metadata_get_dataset_duration",
             )
         except RequestException as e:
+            self.breaker.record_failure()
             log_exception(e)
             raise ServerErrorException
+        finally:
+            stats = connection_stats(self.session)
+            log_add(
+                metadata_http_connections=stats["connections"],
+                metadata_http_requests=stats["requests"],
+            )
+
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
 
         if response.status_code == 200:
             try:
-                return response.json()
-            except JSONDecodeError as e:
+                dataset = codec.loads(response.content)
+                self.cache.set(dataset_id, dataset)
+                self.stale_cache.set(dataset_id, dataset)
+                return dataset
+            except codec.JSONDecodeError as e:
                 # It should not happen that we get status code 200 and an empty
                 # response, but it has. Handle that case gracefully by
                 # pretending that it was a 404 and return None, but log an
@@ -66,10 +169,18 @@ class MetadataApiClient:
                 return None
 
         if response.status_code == 404:
+            self.cache.set(dataset_id, None, ttl=self.not_found_ttl)
+            # Don't serve a deleted dataset during a later outage
+            self.stale_cache.delete(dataset_id)
             return None
         else:
             log_add(metadata_api_response_status_code=response.status_code)
-            log_add(metadata_api_response_body=response.json())
+            try:
+                response_body = codec.loads(response.content)
+            except codec.JSONDecodeError:
+                # Gateways in front of the API answer with HTML (or nothing)
+                response_body = response.text
+            log_add(metadata_api_response_body=response_body)
             raise ServerErrorException
 
 
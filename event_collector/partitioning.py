@@ -0,0 +1,92 @@
+"""Partition key strategies for Kinesis records.
+
+- "random" (the default): a random key per record from a cheap PRNG, which
+  spreads records evenly over the shards.
+- "field": the value of a field in the event (e.g. a device ID), so that all
+  events with the same value land on the same shard, in order.
+- "hash": a hash of such a field, for values that are too long to be used as
+  partition keys or shouldn't be stored in clear text.
+"""
+
+import hashlib
+import os
+import random
+from collections import OrderedDict
+
+MAX_PARTITION_KEY_LENGTH = 256
+
+# Seeded from the OS once; drawing keys from it doesn't need a syscall.
+_random = random.Random(os.urandom(16))
+
+
+def random_key():
+    return f"{_random.getrandbits(128):032x}"
+
+
+def field_value(element, path):
+    """Return the value at `path` (a list of keys) in `element`, or `None`."""
+    value = element
+    for name in path:
+        if not isinstance(value, dict) or name not in value:
+            return None
+        value = value[name]
+    return value
+
+
+def _hash(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def partition_key_function(strategy, field=None):
+    """Return a function computing the partition key of an event element.
+
+    Return `None` for the random strategy, where keys don't depend on the
+    events. Elements missing the field get a random key.
+    """
+    if not strategy or strategy == "random":
+        return None
+
+    if strategy not in ("field", "hash") or not field:
+        raise ValueError(f"Invalid partition key strategy: {strategy} ({field})")
+
+    path = field.split(".")
+
+    def partition_key(element):
+        value = field_value(element, path)
+        if value is None:
+            return random_key()
+        value = str(value)
+        if strategy == "hash" or len(value) > MAX_PARTITION_KEY_LENGTH or not value:
+            return _hash(value)
+        return value
+
+    return partition_key
+
+
+def group_by_key(events, partition_key):
+    """Group `(element, data)` pairs by partition key, keeping their order.
+
+    Return a list of `(key, payloads)` pairs.
+    """
+    groups = OrderedDict()
+    for element, data in events:
+        groups.setdefault(partition_key(element), []).append(data)
+    return list(groups.items())
+
+
+def interleave_by_key(record_list):
+    """Reorder records round-robin over their partition keys.
+
+    Records with the same key keep their relative order, while consecutive
+    records (and thereby each PutRecords chunk) spread over as many keys,
+    and thus shards, as possible.
+    """
+    queues = OrderedDict()
+    for record in record_list:
+        queues.setdefault(record["PartitionKey"], []).append(record)
+
+    interleaved = []
+    queues = list(queues.values())
+    for i in range(max((len(q) for q in queues), default=0)):
+        interleaved.extend(q[i] for q in queues if i < len(q))
+    return interleaved
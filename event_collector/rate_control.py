@@ -0,0 +1,120 @@
+"""Adaptive rate control of PutRecords calls per Kinesis stream.
+
+Every stream gets an AIMD (additive increase, multiplicative decrease)
+controller fed with the outcome of each PutRecords call. When too many
+records are throttled, the stream's submission rate and chunk concurrency
+are cut in half; while calls go through cleanly, they grow back a step at a
+time. Controllers live at module level, so what was learnt about a stream
+carries over to the next warm invocation.
+
+Only `ProvisionedThroughputExceededException` counts as throttling;
+`InternalFailure` says nothing about the stream's capacity.
+"""
+
+import threading
+import time
+
+THROTTLE_ERROR_CODE = "ProvisionedThroughputExceededException"
+
+
+def throttled_count(put_records_response):
+    """Return the number of throttled records in a PutRecords response."""
+    if not put_records_response.get("FailedRecordCount"):
+        return 0
+    return sum(
+        1
+        for result in put_records_response["Records"]
+        if result.get("ErrorCode") == THROTTLE_ERROR_CODE
+    )
+
+
+class RateController:
+    """AIMD controller of the records per second sent to one stream.
+
+    The rate is enforced with a token bucket holding up to `burst` seconds
+    worth of records, so that short bursts go through unpaced.
+    """
+
+    def __init__(
+        self,
+        max_rate=10000,
+        min_rate=10,
+        increase=100,
+        decrease=0.5,
+        throttle_threshold=0.05,
+        max_concurrency=4,
+        burst=1.0,
+        clock=time.monotonic,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.throttle_threshold = throttle_threshold
+        self.max_concurrency = max_concurrency
+        self.burst = burst
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.rate = max_rate
+        self.concurrency = max_concurrency
+        self._tokens = max_rate * burst
+        self._updated_at = clock()
+
+    def reserve(self, records):
+        """Reserve capacity for sending `records` records.
+
+        Return the number of seconds to wait before sending them.
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.rate * self.burst,
+                self._tokens + (now - self._updated_at) * self.rate,
+            )
+            self._updated_at = now
+            self._tokens -= records
+            return max(0, -self._tokens / self.rate)
+
+    def release(self, records):
+        """Give back capacity reserved for records that weren't sent after all."""
+        with self._lock:
+            self._tokens = min(self.rate * self.burst, self._tokens + records)
+
+    def update(self, sent, throttled):
+        """Adjust the rate after `throttled` of `sent` records were throttled."""
+        if not sent:
+            return
+        with self._lock:
+            if throttled / sent > self.throttle_threshold:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.concurrency = max(1, self.concurrency // 2)
+                # Don't let a full bucket defeat the decrease
+                self._tokens = min(self._tokens, self.rate * self.burst)
+            else:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def stats(self):
+        return {"rate": self.rate, "concurrency": self.concurrency}
+
+
+class RateControllerRegistry:
+    """Module-level registry of one `RateController` per stream."""
+
+    def __init__(self, **controller_options):
+        self._controller_options = controller_options
+        self._controllers = {}
+        self._lock = threading.Lock()
+
+    def get(self, stream_name):
+        controller = self._controllers.get(stream_name)
+        if controller is None:
+            with self._lock:
+                controller = self._controllers.setdefault(
+                    stream_name, RateController(**self._controller_options)
+                )
+        return controller
+
+    def clear(self):
+        with self._lock:
+            self._controllers.clear()
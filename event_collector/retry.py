@@ -0,0 +1,42 @@
+import math
+import random
+import time
+
+# Per-record error codes returned by PutRecords that are worth retrying, see
+# https://docs.aws.amazon.com/kinesis/latest/APIReference/API_PutRecordsResultEntry.html
+RETRYABLE_ERROR_CODES = {"ProvisionedThroughputExceededException", "InternalFailure"}
+
+
+def backoff_delay(attempt, base=0.05, cap=1.0):
+    """Return the delay in seconds before retry number `attempt` (from 0).
+
+    Uses exponential backoff with "full jitter", see
+    https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+    """
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class Deadline:
+    """Point in time by which the current invocation must be done.
+
+    `margin` seconds are reserved for building and returning the response.
+    A deadline created without a remaining time never expires.
+    """
+
+    def __init__(self, remaining_time=None, margin=0):
+        if remaining_time is None:
+            self._expires_at = None
+        else:
+            self._expires_at = time.monotonic() + remaining_time - margin
+
+    @classmethod
+    def from_context(cls, context, margin=0):
+        get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining_time is None:
+            return cls()
+        return cls(get_remaining_time() / 1000, margin)
+
+    def remaining(self):
+        if self._expires_at is None:
+            return math.inf
+        return max(0, self._expires_at - time.monotonic())
@@ -0,0 +1,82 @@
+import json
+from json import JSONDecodeError
+
+from event_collector import codec
+
+# Splitting needs the position where each element ends, which only the
+# standard library's `raw_decode` reports, so elements of JSON documents are
+# decoded with it rather than through `codec` (and thus never with orjson).
+_decoder = json.JSONDecoder()
+_whitespace = json.decoder.WHITESPACE
+
+
+def _skip_whitespace(body, idx):
+    return _whitespace.match(body, idx).end()
+
+
+def _payload(body, start, end, element):
+    data = body[start:end]
+    # Records are newline-delimited, so an element spanning several lines
+    # (e.g. from a pretty-printed body) has to be serialized anew.
+    if "\n" in data or "\r" in data:
+        return f"{codec.dumps(element)}\n"
+    return f"{data}\n"
+
+
+def split_events(body):
+    """Split the JSON document `body` into its events.
+
+    `body` is either a JSON array or a single JSON value. Yield an
+    `(element, data)` pair for each event, where `data` is the element's
+    original text plus a trailing newline, ready to be used as Kinesis record
+    data without serializing the element again.
+
+    Raise `json.JSONDecodeError` if `body` isn't a valid JSON document.
+    """
+    idx = _skip_whitespace(body, 0)
+
+    if body.startswith("[", idx):
+        idx = _skip_whitespace(body, idx + 1)
+        if body.startswith("]", idx):
+            idx += 1
+        else:
+            while True:
+                element, end = _decoder.raw_decode(body, idx)
+                yield element, _payload(body, idx, end, element)
+                idx = _skip_whitespace(body, end)
+                if body.startswith(",", idx):
+                    idx = _skip_whitespace(body, idx + 1)
+                elif body.startswith("]", idx):
+                    idx += 1
+                    break
+                else:
+                    raise JSONDecodeError("Expecting ',' delimiter", body, idx)
+    else:
+        element, end = _decoder.raw_decode(body, idx)
+        yield element, _payload(body, idx, end, element)
+        idx = end
+
+    idx = _skip_whitespace(body, idx)
+    if idx != len(body):
+        raise JSONDecodeError("Extra data", body, idx)
+
+
+def split_lines(body):
+    """Split the newline-delimited JSON document `body` into its lines.
+
+    Yield a `(line_number, line)` pair for each non-blank line, numbered from
+    1 and without the line terminator. The lines are not parsed.
+    """
+    start = 0
+    line_number = 0
+    length = len(body)
+
+    while start < length:
+        end = body.find("\n", start)
+        if end == -1:
+            end = length
+        line_number += 1
+        line = body[start:end].rstrip("\r")
+        if line.strip():
+            yield line_number, line
+        start = end + 1
@@ -0,0 +1,161 @@
+"""Spooling of Kinesis records through SQS.
+
+Event streams in the async delivery mode don't have their records put to
+Kinesis while the client waits. The records are instead sent to an SQS queue
+(the spool), and drained into Kinesis by the `flush_spool` entry point.
+
+Each spool message holds a batch of records for a single stream:
+
+    {"stream_name": "...", "records": [{"data": "...", "partition_key": "..."}]}
+
+Compressed (binary) record data is base64 encoded and flagged with
+`"encoding": "base64"`.
+"""
+
+import base64
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from event_collector import codec
+from event_collector.aws_clients import get_client
+from event_collector.instrumentation import log_exception
+
+# SQS limits, see
+# https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/quotas-messages.html
+MAX_MESSAGE_BYTES = 256 * 1024
+MAX_MESSAGES_PER_BATCH = 10
+MAX_BYTES_PER_BATCH = 256 * 1024
+
+# Room for the message envelope around the records
+_ENVELOPE_BYTES = 1024
+
+
+def encode_record(record):
+    data = record["Data"]
+    if isinstance(data, bytes):
+        return {
+            "data": base64.b64encode(data).decode("ascii"),
+            "encoding": "base64",
+            "partition_key": record["PartitionKey"],
+        }
+    return {"data": data, "partition_key": record["PartitionKey"]}
+
+
+def decode_record(entry):
+    data = entry["data"]
+    if entry.get("encoding") == "base64":
+        data = base64.b64decode(data)
+    return {"Data": data, "PartitionKey": entry["partition_key"]}
+
+
+def encode_message(stream_name, entries):
+    return codec.dumps({"stream_name": stream_name, "records": entries})
+
+
+def decode_message(body):
+    """Return the stream name and records of a spool message `body`."""
+    message = codec.loads(body)
+    return (
+        message["stream_name"],
+        [decode_record(entry) for entry in message["records"]],
+    )
+
+
+def pack_messages(stream_name, record_list, max_bytes=MAX_MESSAGE_BYTES):
+    """Pack `record_list` into as few spool messages as possible.
+
+    Return a tuple `(messages, oversized_records)`, where `messages` is a list
+    of `(body, records)` pairs, and `oversized_records` are the records that
+    don't fit in a message on their own.
+    """
+    messages = []
+    oversized_records = []
+    entries = []
+    records = []
+    size = _ENVELOPE_BYTES
+
+    def flush():
+        messages.append((encode_message(stream_name, entries), records))
+
+    for record in record_list:
+        entry = encode_record(record)
+        entry_size = len(codec.dumps(entry).encode("utf-8")) + 1
+        if _ENVELOPE_BYTES + entry_size > max_bytes:
+            oversized_records.append(record)
+            continue
+
+        if entries and size + entry_size > max_bytes:
+            flush()
+            entries = []
+            records = []
+            size = _ENVELOPE_BYTES
+
+        entries.append(entry)
+        records.append(record)
+        size += entry_size
+
+    if entries:
+        flush()
+
+    return messages, oversized_records
+
+
+def batch_messages(messages):
+    """Split `(body, records)` pairs into SendMessageBatch sized batches."""
+    batches = []
+    batch = []
+    batch_bytes = 0
+
+    for message in messages:
+        size = len(message[0].encode("utf-8"))
+        if batch and (
+            len(batch) >= MAX_MESSAGES_PER_BATCH
+            or batch_bytes + size > MAX_BYTES_PER_BATCH
+        ):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(message)
+        batch_bytes += size
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def spool_records(queue_url, stream_name, record_list):
+    """Send `record_list` for `stream_name` to the spool queue at `queue_url`.
+
+    Return the records that could not be spooled, either because they are too
+    large for a message or because SQS failed to accept them. The caller is
+    responsible for delivering those some other way. When a call to SQS
+    fails, the batches that haven't been sent yet are given up on too, while
+    those already sent stay spooled.
+    """
+    sqs_client = get_client("sqs")
+    messages, unspooled_records = pack_messages(stream_name, record_list)
+    batches = batch_messages(messages)
+
+    for i, batch in enumerate(batches):
+        try:
+            response = sqs_client.send_message_batch(
+                QueueUrl=queue_url,
+                Entries=[
+                    {"Id": str(j), "MessageBody": body}
+                    for j, (body, _) in enumerate(batch)
+                ],
+            )
+        except (BotoCoreError, ClientError) as e:
+            log_exception(e)
+            unspooled_records.extend(
+                record
+                for unsent_batch in batches[i:]
+                for _, records in unsent_batch
+                for record in records
+            )
+            break
+        for failure in response.get("Failed", []):
+            unspooled_records.extend(batch[int(failure["Id"])][1])
+
+    return unspooled_records
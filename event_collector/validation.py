@@ -0,0 +1,108 @@
+import json
+import threading
+
+from jsonschema import validators
+
+from event_collector.cache import MISSING, TTLCache
+
+POST_EVENTS_REQUEST_SCHEMA_PATH = (
+    "serverless/documentation/schemas/postEventsRequest.json"
+)
+
+# Schema keywords that don't affect validation
+ANNOTATION_KEYWORDS = {"$schema", "$id", "title", "description"}
+
+_post_events_validator = None
+_post_events_item_validator = None
+_array_of_objects = False
+_lock = threading.Lock()
+
+# Compiled per-dataset item validators, keyed on (dataset_id, version)
+item_validators = TTLCache(maxsize=128, ttl=float("inf"))
+
+
+def compile_schema(schema):
+    """Check `schema` and return a validator instance for it."""
+    validator_class = validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
+
+def _is_array_of_objects_schema(schema):
+    keywords = {k: v for k, v in schema.items() if k not in ANNOTATION_KEYWORDS}
+    return keywords == {"type": "array", "items": {"type": "object"}}
+
+
+def post_events_validator():
+    """Return the validator for the post events request body.
+
+    The schema is read and compiled only once per container.
+    """
+    global _post_events_validator
+    global _post_events_item_validator
+    global _array_of_objects
+
+    if _post_events_validator is None:
+        with _lock:
+            if _post_events_validator is None:
+                with open(POST_EVENTS_REQUEST_SCHEMA_PATH) as f:
+                    schema = json.loads(f.read())
+                _array_of_objects = _is_array_of_objects_schema(schema)
+                _post_events_item_validator = compile_schema(schema.get("items", {}))
+                _post_events_validator = compile_schema(schema)
+
+    return _post_events_validator
+
+
+def validate_events(event_body):
+    """Validate `event_body` against the post events request schema.
+
+    Raise `jsonschema.ValidationError` if it doesn't conform.
+    """
+    validator = post_events_validator()
+
+    # As long as the schema only asks for an array of objects, a plain type
+    # check is all that's needed for the common case of a valid body.
+    if (
+        _array_of_objects
+        and type(event_body) is list
+        and all(type(element) is dict for element in event_body)
+    ):
+        return
+
+    validator.validate(event_body)
+
+
+def validate_event(element):
+    """Validate a single event against the items of the request schema.
+
+    Used for bodies that are processed one event at a time, like NDJSON.
+    Raise `jsonschema.ValidationError` if it doesn't conform.
+    """
+    post_events_validator()
+
+    if _array_of_objects and type(element) is dict:
+        return
+
+    _post_events_item_validator.validate(element)
+
+
+def get_item_validator(dataset, version):
+    """Return a validator for single events of `dataset` in `version`.
+
+    The item schema is read from the `schema` field of the version in the
+    dataset metadata. Return `None` when the version has no schema.
+    """
+    versions = dataset.get("_embedded", {}).get("versions", [])
+    schema = next((v.get("schema") for v in versions if v["version"] == version), None)
+    if not schema:
+        return None
+
+    key = (dataset["Id"], version)
+    cached = item_validators.get(key)
+    if cached is not MISSING and cached[0] == schema:
+        return cached[1]
+
+    validator = compile_schema(schema)
+    item_validators.set(key, (schema, validator))
+    return validator
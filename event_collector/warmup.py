@@ -0,0 +1,88 @@
+"""Warm-up of a fresh container before (or between) real requests.
+
+A warm-up builds the clients and preloads the caches for a configured set of
+hot datasets, so that the first requests after a scale-out don't all pay for
+metadata API calls, event stream lookups and client construction. It runs at
+init when `WARMUP_ON_INIT` is set, and whenever a handler is invoked by a
+warm-up event instead of an API Gateway request.
+"""
+
+from concurrent.futures import wait
+
+from event_collector.instrumentation import submit
+
+# Attributes telling when an event stream item was last changed, newest first
+_TIMESTAMP_ATTRIBUTES = ["updated_at", "create_time"]
+
+
+def is_warmup_event(event):
+    """Return whether `event` is a warm-up invocation rather than a request.
+
+    Both scheduled EventBridge events and custom `{"warmup": true}` payloads
+    count as warm-up events.
+    """
+    if not isinstance(event, dict) or "httpMethod" in event:
+        return False
+    if event.get("warmup") is True:
+        return True
+    return event.get("source") == "aws.events" and (
+        event.get("detail-type") == "Scheduled Event"
+    )
+
+
+def parse_datasets(value):
+    """Parse a comma separated list of `dataset_id/version` pairs.
+
+    The version may be left out, in which case only the dataset metadata is
+    preloaded.
+    """
+    datasets = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        dataset_id, _, version = entry.partition("/")
+        datasets.append((dataset_id, version or None))
+    return datasets
+
+
+def recent_datasets(event_stream_items, limit):
+    """Return the datasets of the `limit` most recently changed event streams.
+
+    Items are `event-streams` table items, with IDs on the form
+    `dataset_id/version`.
+    """
+
+    def changed_at(item):
+        for attribute in _TIMESTAMP_ATTRIBUTES:
+            if item.get(attribute):
+                return str(item[attribute])
+        return ""
+
+    latest = {}
+    for item in event_stream_items:
+        current = latest.get(item["id"])
+        if current is None or item["config_version"] > current["config_version"]:
+            latest[item["id"]] = item
+
+    items = [item for item in latest.values() if not item.get("deleted")]
+    datasets = []
+    for item in sorted(items, key=changed_at, reverse=True)[:limit]:
+        dataset_id, _, version = item["id"].partition("/")
+        datasets.append((dataset_id, version or None))
+    return datasets
+
+
+def run(tasks, executor, timeout=None):
+    """Run the warm-up `tasks` concurrently on `executor`.
+
+    Return the number of tasks that finished successfully within `timeout`
+    seconds. Tasks still running by then are left to finish on their own,
+    while those that haven't started are cancelled, so that they don't hold
+    up the lookups of real requests sharing `executor`.
+    """
+    futures = [submit(executor, task) for task in tasks]
+    done, not_done = wait(futures, timeout=timeout)
+    for future in not_done:
+        future.cancel()
+    return sum(1 for future in done if future.exception() is None)
@@ -33,4 +33,11 @@ setuptools.setup(
         # is dropped there.
         "simplejson",
     ],
+    extras_require={
+        # Faster JSON decoding, picked up by `event_collector.codec` when
+        # installed.
+        "orjson": ["orjson"],
+        # Zstandard compression of record data, see `event_collector.compression`
+        "zstd": ["zstandard"],
+    },
 )
@@ -0,0 +1,147 @@
+import base64
+import json
+import time
+
+import pytest
+
+from event_collector.auth import (
+    CachedResourceAuthorizer,
+    CachedWebhookAuthorizer,
+    token_digest,
+    token_expiry,
+    token_principal,
+)
+
+
+def _token(claims):
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=")
+
+    return b".".join([encode({"alg": "RS256"}), encode(claims), b"sig"]).decode()
+
+
+class FakeResourceAuthorizer:
+    def __init__(self, has_access):
+        self._has_access = has_access
+        self.calls = 0
+
+    def has_access(self, access_token, scope, resource_name):
+        self.calls += 1
+        return self._has_access
+
+
+def test_token_expiry():
+    assert token_expiry(_token({"exp": 1234567890})) == 1234567890
+    assert token_expiry(_token({"sub": "someone"})) is None
+    assert token_expiry("not-a-jwt") is None
+    assert token_expiry("a.%%%.c") is None
+
+
+def test_token_principal():
+    assert token_principal(_token({"sub": "someone", "exp": 1})) == "sub:someone"
+    assert token_principal(_token({"sub": "someone", "exp": 2})) == "sub:someone"
+    assert token_principal("not-a-jwt") == f"token:{token_digest('not-a-jwt')}"
+
+
+def test_has_access_cached():
+    fake = FakeResourceAuthorizer(True)
+    authorizer = CachedResourceAuthorizer(fake)
+    token = _token({"exp": time.time() + 60})
+
+    for _ in range(3):
+        assert authorizer.has_access(token, "scope", "okdata:dataset:d123")
+    assert fake.calls == 1
+    assert authorizer.stats()["hits"] == 2
+
+    assert authorizer.has_access(token, "scope", "okdata:dataset:other")
+    assert fake.calls == 2
+
+
+def test_has_access_expired_token_not_cached():
+    fake = FakeResourceAuthorizer(True)
+    authorizer = CachedResourceAuthorizer(fake)
+    token = _token({"exp": time.time() - 1})
+
+    authorizer.has_access(token, "scope", "resource")
+    authorizer.has_access(token, "scope", "resource")
+    assert fake.calls == 2
+
+
+def test_has_access_without_expiry_not_cached():
+    fake = FakeResourceAuthorizer(True)
+    authorizer = CachedResourceAuthorizer(fake)
+
+    authorizer.has_access("opaque-token", "scope", "resource")
+    authorizer.has_access("opaque-token", "scope", "resource")
+    assert fake.calls == 2
+
+
+def test_has_access_negative_ttl():
+    fake = FakeResourceAuthorizer(False)
+    authorizer = CachedResourceAuthorizer(fake, negative_ttl=0)
+    token = _token({"exp": time.time() + 60})
+
+    assert not authorizer.has_access(token, "scope", "resource")
+    assert not authorizer.has_access(token, "scope", "resource")
+    assert fake.calls == 2
+
+    authorizer = CachedResourceAuthorizer(fake, negative_ttl=10)
+    authorizer.has_access(token, "scope", "resource")
+    authorizer.has_access(token, "scope", "resource")
+    assert fake.calls == 3
+
+
+class FakeWebhookClient:
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def authorize_webhook_token(self, dataset_id, token, operation, retries):
+        self.calls += 1
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+def test_authorize_webhook_token_cached():
+    fake = FakeWebhookClient({"access": True, "reason": None})
+    authorizer = CachedWebhookAuthorizer(fake)
+
+    for _ in range(3):
+        response = authorizer.authorize_webhook_token("d123", "token", "write")
+        assert response == {"access": True, "reason": None}
+    assert fake.calls == 1
+
+    authorizer.authorize_webhook_token("d456", "token", "write")
+    authorizer.authorize_webhook_token("d123", "other-token", "write")
+    assert fake.calls == 3
+    assert authorizer.stats()["hit_ratio"] == 0.4
+
+
+def test_authorize_webhook_token_denied_ttl():
+    fake = FakeWebhookClient({"access": False, "reason": "Forbidden"})
+    authorizer = CachedWebhookAuthorizer(fake, negative_ttl=0)
+
+    authorizer.authorize_webhook_token("d123", "token", "write")
+    authorizer.authorize_webhook_token("d123", "token", "write")
+    assert fake.calls == 2
+
+
+def test_authorize_webhook_token_errors_not_cached():
+    fake = FakeWebhookClient(ConnectionError("Boom"))
+    authorizer = CachedWebhookAuthorizer(fake)
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            authorizer.authorize_webhook_token("d123", "token", "write")
+    assert fake.calls == 2
+    assert len(authorizer.cache) == 0
+
+
+def test_authorize_webhook_token_without_token():
+    fake = FakeWebhookClient({"access": False, "reason": "Missing token"})
+    authorizer = CachedWebhookAuthorizer(fake)
+
+    authorizer.authorize_webhook_token("d123", None, "write")
+    authorizer.authorize_webhook_token("d123", None, "write")
+    assert fake.calls == 2
@@ -0,0 +1,31 @@
+import pytest
+
+import event_collector.aws_clients as aws_clients
+
+
+@pytest.fixture(autouse=True)
+def aws_clients_reset():
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
+
+
+def test_get_client_reused():
+    client = aws_clients.get_client("kinesis")
+    assert aws_clients.get_client("kinesis") is client
+    assert client.meta.region_name == aws_clients.REGION
+
+
+def test_set_client_and_reset():
+    fake_client = object()
+    aws_clients.set_client("kinesis", fake_client)
+    assert aws_clients.get_client("kinesis") is fake_client
+
+    aws_clients.reset()
+    assert aws_clients.get_client("kinesis") is not fake_client
+
+
+def test_deserialize_item():
+    assert aws_clients.deserialize_item(
+        {"id": {"S": "d123/1"}, "config_version": {"N": "2"}}
+    ) == {"id": "d123/1", "config_version": 2}
@@ -0,0 +1,64 @@
+from event_collector.batching import aggregate_payloads, chunk_records, record_size
+
+
+def _record(data, partition_key="aa-bb"):
+    return {"Data": data, "PartitionKey": partition_key}
+
+
+def test_record_size():
+    assert record_size(_record("{}\n")) == 8
+    assert record_size(_record("æ\n", "k")) == 4
+    assert record_size(_record(b"\x1f\x8b", "k")) == 3
+
+
+def test_chunk_records_max_records():
+    record_list = [_record(f"{i}\n") for i in range(1201)]
+    chunks, oversized_records = chunk_records(record_list)
+
+    assert [len(chunk) for chunk in chunks] == [500, 500, 201]
+    assert [record for chunk in chunks for record in chunk] == record_list
+    assert oversized_records == []
+
+
+def test_chunk_records_max_bytes():
+    record_list = [_record("x" * 95) for i in range(10)]
+    chunks, _ = chunk_records(record_list, max_bytes=250)
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 2, 2, 2]
+
+
+def test_chunk_records_distinct_keys():
+    record_list = [_record(f"{i}\n", key) for i, key in enumerate("abcaab")]
+    chunks, _ = chunk_records(record_list, distinct_keys=True)
+
+    assert [[r["PartitionKey"] for r in chunk] for chunk in chunks] == [
+        ["a", "b", "c"],
+        ["a"],
+        ["a", "b"],
+    ]
+
+
+def test_chunk_records_oversized():
+    small = _record("x")
+    large = _record("x" * 100)
+    chunks, oversized_records = chunk_records(
+        [small, large, small], max_record_bytes=50
+    )
+
+    assert chunks == [[small, small]]
+    assert oversized_records == [large]
+
+
+def test_aggregate_payloads():
+    payloads = ["aaaa\n", "bbbb\n", "cccc\n", "dddddddddddd\n", "e\n"]
+    assert list(aggregate_payloads(payloads, 10)) == [
+        "aaaa\nbbbb\n",
+        "cccc\n",
+        "dddddddddddd\n",
+        "e\n",
+    ]
+
+
+def test_aggregate_payloads_capped_at_record_limit():
+    payloads = ["x" * 1024 * 512] * 2
+    assert len(list(aggregate_payloads(payloads, 10 * 1024 * 1024))) == 2
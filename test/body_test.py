@@ -0,0 +1,79 @@
+import base64
+import gzip
+import zlib
+
+import pytest
+
+from event_collector.body import (
+    BodyDecodeError,
+    BodyTooLargeError,
+    UnsupportedEncodingError,
+    decode_body,
+)
+
+BODY = '[{"key00": "value00"}, {"key10": "æøå"}]'
+
+
+def _event(data, content_encoding=None, base64_encoded=True):
+    headers = {"Content-Encoding": content_encoding} if content_encoding else {}
+    if base64_encoded:
+        data = base64.b64encode(data).decode()
+    return {"body": data, "headers": headers, "isBase64Encoded": base64_encoded}
+
+
+def test_decode_plain_body():
+    assert decode_body({"body": BODY}, 1024) == BODY
+    assert decode_body({"body": None}, 1024) == ""
+
+
+def test_decode_base64_body():
+    assert decode_body(_event(BODY.encode()), 1024) == BODY
+
+
+@pytest.mark.parametrize(
+    "content_encoding,compress",
+    [
+        ("gzip", gzip.compress),
+        ("deflate", zlib.compress),
+        ("deflate", lambda data: zlib.compress(data, wbits=-zlib.MAX_WBITS)),
+    ],
+)
+def test_decode_compressed_body(content_encoding, compress):
+    event = _event(compress(BODY.encode()), content_encoding)
+    assert decode_body(event, 1024) == BODY
+
+
+def test_decode_compressed_body_in_chunks(monkeypatch):
+    monkeypatch.setattr("event_collector.body.CHUNK_SIZE", 8)
+    body = BODY * 100
+    event = _event(gzip.compress(body.encode()), "gzip")
+    assert decode_body(event, 1024 * 1024) == body
+
+
+def test_decode_body_too_large():
+    bomb = gzip.compress(b"[" + b" " * 10 * 1024 * 1024 + b"]")
+    with pytest.raises(BodyTooLargeError):
+        decode_body(_event(bomb, "gzip"), 1024 * 1024)
+
+    with pytest.raises(BodyTooLargeError):
+        decode_body(_event(BODY.encode()), 10)
+
+
+def test_decode_unsupported_encoding():
+    with pytest.raises(UnsupportedEncodingError):
+        decode_body(_event(BODY.encode(), "br"), 1024)
+
+
+@pytest.mark.parametrize(
+    "event",
+    [
+        {"body": "not base64!", "isBase64Encoded": True},
+        _event(b"not gzip", "gzip"),
+        _event(gzip.compress(BODY.encode())[:-10], "gzip"),
+        _event(gzip.compress(BODY.encode()), "gzip", base64_encoded=False),
+        _event("æ".encode("latin-1")),
+    ],
+)
+def test_decode_invalid_body(event):
+    with pytest.raises(BodyDecodeError):
+        decode_body(event, 1024)
@@ -0,0 +1,31 @@
+import json
+
+import pytest
+
+from event_collector import codec
+
+
+def test_loads():
+    assert codec.loads('{"a": [1, 2.5, "æ"]}') == {"a": [1, 2.5, "æ"]}
+    assert codec.loads(b'{"a": null}') == {"a": None}
+
+
+def test_loads_accepts_what_stdlib_accepts():
+    assert codec.loads('{"a": NaN}')["a"] != 0
+    assert codec.loads('{"a": 1e400}') == {"a": float("inf")}
+
+
+def test_loads_exact():
+    assert codec.loads('{"a": 123456789012345678901234567890}', exact=True) == {
+        "a": 123456789012345678901234567890
+    }
+
+
+def test_loads_invalid():
+    with pytest.raises(codec.JSONDecodeError):
+        codec.loads("{")
+
+
+def test_dumps_matches_stdlib():
+    obj = {"a": [1, 2.5, "æ", None], "b": {"c": True}}
+    assert codec.dumps(obj) == json.dumps(obj)
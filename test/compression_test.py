@@ -0,0 +1,32 @@
+import pytest
+
+from event_collector import compression
+
+DATA = '{"key00": "value00"}\n{"key10": "value10"}\n'
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compress_and_decompress(codec):
+    if not compression.available(codec):
+        pytest.skip(f"{codec} not available")
+
+    compressed = compression.compress(DATA, codec)
+    assert isinstance(compressed, bytes)
+    assert compression.decompress(compressed) == DATA
+
+
+def test_compressed_data_is_marked():
+    assert compression.compress(DATA, "gzip").startswith(compression.GZIP_MAGIC)
+    if compression.available("zstd"):
+        assert compression.compress(DATA, "zstd").startswith(compression.ZSTD_MAGIC)
+
+
+def test_decompress_plain_data():
+    assert compression.decompress(DATA) == DATA
+    assert compression.decompress(DATA.encode()) == DATA
+
+
+def test_unsupported_codec():
+    assert not compression.available("lz4")
+    with pytest.raises(ValueError):
+        compression.compress(DATA, "lz4")
@@ -0,0 +1,41 @@
+import threading
+import time
+
+from event_collector.event_streams import EventStreamRegistry
+
+
+def test_get_cached():
+    calls = []
+
+    def load(event_stream_id):
+        calls.append(event_stream_id)
+        return None
+
+    registry = EventStreamRegistry(load)
+    assert registry.get("d123/1") is None
+    assert registry.get("d123/1") is None
+    assert calls == ["d123/1"]
+
+    registry.clear()
+    registry.get("d123/1")
+    assert calls == ["d123/1", "d123/1"]
+
+
+def test_get_single_flight():
+    calls = []
+
+    def load(event_stream_id):
+        calls.append(event_stream_id)
+        time.sleep(0.05)
+        return {"id": event_stream_id, "config_version": 1}
+
+    registry = EventStreamRegistry(load)
+    threads = [
+        threading.Thread(target=registry.get, args=("d123/1",)) for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["d123/1"]
@@ -1,28 +1,85 @@
+import base64
+import gzip
 import json
+import threading
+import time
 
 import pytest
 from aws_xray_sdk.core import xray_recorder
-from moto import mock_kinesis, mock_dynamodb2
+from botocore.exceptions import ReadTimeoutError
+from moto import mock_kinesis, mock_dynamodb2, mock_sqs
 
 from okdata.resource_auth import ResourceAuthorizer
 from okdata.sdk.webhook.client import WebhookClient
 
+import event_collector.aws_clients as aws_clients
 import event_collector.handler as handler
+import event_collector.partitioning as partitioning
+import event_collector.spool as spool
+from event_collector.batching import chunk_records
+from event_collector.event_streams import stream_options
+from event_collector.retry import Deadline
+from event_collector.splitter import split_events
 import test.test_data.event_to_record_data as event_to_record_data
 import test.test_data.extract_event_body_test_data as extract_event_body_test_data
 import test.test_data.get_failed_records_data as get_failed_records_data
 import test.test_data.post_event_data as post_event_data
-from test.test_utils import create_event_stream, create_event_streams_table
+from test.test_utils import (
+    create_event_stream,
+    create_event_streams_table,
+    create_spool_queue,
+    receive_spool_messages,
+)
 
 xray_recorder.begin_segment("Test")
 
 
+@pytest.fixture(autouse=True)
+def aws_clients_reset():
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
+
+
+@pytest.fixture(autouse=True)
+def rate_controllers_reset():
+    handler.rate_controllers.clear()
+    yield
+    handler.rate_controllers.clear()
+
+
 def test_event_to_record_list():
-    record_list = handler.event_to_record_list(event_to_record_data.event_body)
+    events = split_events(json.dumps(event_to_record_data.event_body))
+    record_list = handler.event_to_record_list(events)
     pairs = zip(record_list, event_to_record_data.expected)
     assert not any(x["Data"] != y["Data"] for x, y in pairs)
 
 
+def test_event_to_record_list_aggregated():
+    events = split_events(json.dumps(event_to_record_data.event_body))
+    record_list = handler.event_to_record_list(events, aggregation_size=90)
+    assert [record["Data"] for record in record_list] == [
+        event_to_record_data.expected[0]["Data"]
+        + event_to_record_data.expected[1]["Data"],
+        event_to_record_data.expected[2]["Data"]
+        + event_to_record_data.expected[3]["Data"],
+    ]
+
+
+def test_event_to_record_list_partition_key():
+    events = [({"id": i % 2}, f'{{"id": {i % 2}}}\n') for i in range(4)]
+    partition_key = partitioning.partition_key_function("field", "id")
+
+    record_list = handler.event_to_record_list(
+        events, aggregation_size=1024, partition_key=partition_key
+    )
+
+    assert record_list == [
+        {"Data": '{"id": 0}\n{"id": 0}\n', "PartitionKey": "0"},
+        {"Data": '{"id": 1}\n{"id": 1}\n', "PartitionKey": "1"},
+    ]
+
+
 def test_get_failed_records():
     failed_records_list = handler.get_failed_records(
         get_failed_records_data.put_records_response,
@@ -48,6 +105,126 @@ def test_put_records_to_kinesis():
     assert put_records_response[1] == []
 
 
+class FakeKinesisClient:
+    def __init__(self, error_codes):
+        # One list of per-record error codes (or None) for each call
+        self.error_codes = error_codes
+        self.calls = []
+
+    def put_records(self, StreamName, Records):
+        self.calls.append(Records)
+        error_codes = self.error_codes[len(self.calls) - 1]
+        results = [
+            {"ErrorCode": code, "ErrorMessage": "Failed"} if code else {}
+            for code in error_codes
+        ]
+        return {
+            "FailedRecordCount": len([code for code in error_codes if code]),
+            "Records": results,
+            "ResponseMetadata": {"RetryAttempts": 0},
+        }
+
+
+def test_put_records_to_kinesis_retries_throttled_records(monkeypatch):
+    monkeypatch.setattr(handler, "kinesis_backoff_base", 0)
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient([[None, throttled, "InternalFailure"], [None, None]])
+    aws_clients.set_client("kinesis", client)
+    record_list = get_failed_records_data.record_list[:3]
+
+    _, failed_record_list = handler.put_records_to_kinesis(record_list, "stream", 3)
+
+    assert failed_record_list == []
+    assert client.calls == [record_list, record_list[1:]]
+
+
+def test_put_records_to_kinesis_does_not_retry_other_errors(monkeypatch):
+    monkeypatch.setattr(handler, "kinesis_backoff_base", 0)
+    client = FakeKinesisClient([[None, "KMSAccessDeniedException"]])
+    aws_clients.set_client("kinesis", client)
+    record_list = get_failed_records_data.record_list[:2]
+
+    _, failed_record_list = handler.put_records_to_kinesis(record_list, "stream", 3)
+
+    assert failed_record_list == record_list[1:]
+    assert len(client.calls) == 1
+
+
+def test_put_records_to_kinesis_stops_at_deadline():
+    client = FakeKinesisClient([["InternalFailure"]])
+    aws_clients.set_client("kinesis", client)
+    record_list = get_failed_records_data.record_list[:1]
+
+    _, failed_record_list = handler.put_records_to_kinesis(
+        record_list, "stream", 3, deadline=Deadline(0)
+    )
+
+    assert failed_record_list == record_list
+    assert len(client.calls) == 1
+
+
+def test_put_records_to_kinesis_adapts_rate_to_throttling(monkeypatch):
+    monkeypatch.setattr(handler, "kinesis_backoff_base", 0)
+    throttled = "ProvisionedThroughputExceededException"
+    client = FakeKinesisClient(
+        [[throttled, throttled], [None, None], ["InternalFailure"] * 2, [None, None]]
+    )
+    aws_clients.set_client("kinesis", client)
+    record_list = get_failed_records_data.record_list[:2]
+    controller = handler.rate_controllers.get("stream")
+    max_rate = controller.rate
+
+    handler.put_records_to_kinesis(record_list, "stream", 3)
+    assert controller.rate < max_rate
+    decreased_rate = controller.rate
+
+    # Internal failures say nothing about the stream's capacity
+    handler.put_records_to_kinesis(record_list, "stream", 3)
+    assert controller.rate > decreased_rate
+    assert handler.rate_controllers.get("other").rate == max_rate
+
+
+def test_put_records_to_kinesis_gives_up_when_rate_limited_past_deadline():
+    client = FakeKinesisClient([[None] * 3])
+    aws_clients.set_client("kinesis", client)
+    record_list = get_failed_records_data.record_list[:3]
+    controller = handler.rate_controllers.get("stream")
+    controller.rate = 1
+    controller.reserve(controller.rate * controller.burst)
+
+    start = time.monotonic()
+    _, failed_record_list = handler.put_records_to_kinesis(
+        record_list, "stream", 3, deadline=Deadline(1)
+    )
+
+    assert time.monotonic() - start < 0.5
+    assert failed_record_list == record_list
+    assert client.calls == []
+
+
+def test_put_chunks_to_kinesis_limits_concurrency(monkeypatch):
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        with lock:
+            in_flight.append(record_list)
+            max_in_flight.append(len(in_flight))
+        time.sleep(0.01)
+        with lock:
+            in_flight.remove(record_list)
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    handler.rate_controllers.get("stream").concurrency = 2
+    chunks = [[{"Data": f"{i}\n", "PartitionKey": "k"}] for i in range(8)]
+
+    assert handler.put_chunks_to_kinesis(chunks, "stream", 3) == []
+    assert len(max_in_flight) == 8
+    assert max(max_in_flight) <= 2
+
+
 @mock_kinesis
 def test_post_events(metadata_api, mock_auth, mock_stream_name):
     stream_name = post_event_data.stream_name
@@ -56,6 +233,254 @@ def test_post_events(metadata_api, mock_auth, mock_stream_name):
     assert post_event_response == post_event_data.ok_response
 
 
+@mock_kinesis
+def test_post_events_large_batch(metadata_api, mock_auth, mock_stream_name):
+    stream_name = post_event_data.stream_name
+    create_event_stream(stream_name)
+    oversized_element = {"key": "x" * (1024 * 1024)}
+    event = {
+        **post_event_data.event_with_list,
+        "body": json.dumps(
+            [{f"key{i}": f"value{i}"} for i in range(1200)] + [oversized_element]
+        ),
+    }
+    post_event_response = handler.post_events(event, {})
+    assert post_event_response["statusCode"] == 500
+    assert json.loads(post_event_response["body"])["failedElements"] == [
+        oversized_element
+    ]
+
+
+def test_post_events_aggregated_compressed_failed_records(
+    metadata_api, mock_auth, mock_stream_name, monkeypatch
+):
+    monkeypatch.setattr(
+        handler,
+        "get_stream_options",
+        lambda dataset_id, version: stream_options(
+            {"record_aggregation_size": 1024, "record_compression": "gzip"}
+        ),
+    )
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", record_list
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+
+    post_event_response = handler.post_events(post_event_data.event_with_list, {})
+
+    assert len(put_record_lists) == 1
+    assert len(put_record_lists[0]) == 1
+    assert put_record_lists[0][0]["Data"].startswith(b"\x1f\x8b")
+    assert post_event_response["statusCode"] == 500
+    assert json.loads(post_event_response["body"])["failedElements"] == json.loads(
+        post_event_data.event_with_list["body"]
+    )
+
+
+@mock_kinesis
+def test_post_events_partition_key_ordered(
+    metadata_api, mock_auth, mock_stream_name, monkeypatch
+):
+    monkeypatch.setattr(
+        handler,
+        "get_stream_options",
+        lambda dataset_id, version: stream_options(
+            {
+                "partition_key_strategy": "field",
+                "partition_key_field": "device",
+                "ordered_delivery": True,
+                # A record per event
+                "record_aggregation_size": 1,
+            }
+        ),
+    )
+    monkeypatch.setattr(
+        handler,
+        "chunk_records",
+        lambda record_list, **kwargs: chunk_records(
+            record_list, max_records=3, **kwargs
+        ),
+    )
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    event = {
+        **post_event_data.event_with_list,
+        "body": json.dumps([{"device": f"d{i % 3}", "seq": i} for i in range(9)]),
+    }
+
+    post_event_response = handler.post_events(event, {})
+
+    assert post_event_response["statusCode"] == 200
+    # Every chunk spans all keys, and chunks are put in order.
+    assert [[r["PartitionKey"] for r in rl] for rl in put_record_lists] == [
+        ["d0", "d1", "d2"]
+    ] * 3
+    sequence = [json.loads(r["Data"])["seq"] for rl in put_record_lists for r in rl]
+    assert sequence == list(range(9))
+
+
+@pytest.mark.parametrize("ordered_delivery", [False, True])
+def test_post_events_partition_key_single_key(
+    metadata_api, mock_auth, mock_stream_name, monkeypatch, ordered_delivery
+):
+    monkeypatch.setattr(
+        handler,
+        "get_stream_options",
+        lambda dataset_id, version: stream_options(
+            {
+                "partition_key_strategy": "field",
+                "partition_key_field": "device",
+                "ordered_delivery": ordered_delivery,
+            }
+        ),
+    )
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    event = {
+        **post_event_data.event_with_list,
+        "body": json.dumps([{"device": "d0", "seq": i} for i in range(1000)]),
+    }
+
+    assert handler.post_events(event, {})["statusCode"] == 200
+    # The events are aggregated into a single record instead of a call each.
+    assert len(put_record_lists) == 1
+    assert len(put_record_lists[0]) == 1
+    data = put_record_lists[0][0]["Data"]
+    assert [json.loads(line)["seq"] for line in data.splitlines()] == list(range(1000))
+
+
+def test_put_chunks_to_kinesis_ordered_holds_back_failed_keys(monkeypatch):
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", [r for r in record_list if r["Data"] == "a1"]
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    chunks = [
+        [{"Data": f"{key}{i}", "PartitionKey": key} for key in "ab"] for i in range(3)
+    ]
+
+    failed_record_list = handler.put_chunks_to_kinesis(
+        chunks, "stream", 3, ordered=True
+    )
+
+    assert [r["Data"] for r in failed_record_list] == ["a1", "a2"]
+    assert [[r["Data"] for r in rl] for rl in put_record_lists] == [
+        ["a0", "b0"],
+        ["a1", "b1"],
+        ["b2"],
+    ]
+
+
+@mock_kinesis
+def test_post_events_gzip_body(metadata_api, mock_auth, mock_stream_name):
+    stream_name = post_event_data.stream_name
+    create_event_stream(stream_name)
+    event = {
+        **post_event_data.event_with_list,
+        "headers": {
+            **post_event_data.event_with_list["headers"],
+            "Content-Encoding": "gzip",
+        },
+        "body": base64.b64encode(
+            gzip.compress(post_event_data.event_with_list["body"].encode())
+        ).decode(),
+        "isBase64Encoded": True,
+    }
+    post_event_response = handler.post_events(event, {})
+    assert post_event_response == post_event_data.ok_response
+
+
+def test_post_events_compressed_body_not_binary(
+    metadata_api, mock_auth, mock_stream_name
+):
+    event = {
+        **post_event_data.event_with_list,
+        "headers": {
+            **post_event_data.event_with_list["headers"],
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        },
+    }
+    response = handler.post_events(event, {})
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["message"] == (
+        "Compressed bodies must be sent as application/octet-stream"
+    )
+
+
+def _ndjson_event(body):
+    return {
+        **post_event_data.event_with_list,
+        "headers": {
+            **post_event_data.event_with_list["headers"],
+            "Content-Type": "application/x-ndjson; charset=utf-8",
+        },
+        "body": body,
+    }
+
+
+@mock_kinesis
+def test_post_events_ndjson(metadata_api, mock_auth, mock_stream_name):
+    stream_name = post_event_data.stream_name
+    create_event_stream(stream_name)
+    post_event_response = handler.post_events(
+        _ndjson_event('{"key00": "value00"}\n{"key10": "value10"}\n'), {}
+    )
+    assert post_event_response == post_event_data.ok_response
+
+
+def test_validate_event_body_ndjson():
+    events, error = handler.validate_event_body(
+        _ndjson_event('{"key00": "value00"}\r\n\n{"key10":"value10"}')
+    )
+    assert error is None
+    assert events == [
+        ({"key00": "value00"}, '{"key00": "value00"}\n'),
+        ({"key10": "value10"}, '{"key10":"value10"}\n'),
+    ]
+
+
+def test_post_events_ndjson_invalid_line(metadata_api, mock_auth, mock_stream_name):
+    post_event_response = handler.post_events(
+        _ndjson_event('{"key00": "value00"}\n\n{"key10": \n'), {}
+    )
+    assert post_event_response == {
+        "statusCode": 400,
+        "body": '{"message": "Line 3 is not a valid JSON document"}',
+    }
+
+    post_event_response = handler.post_events(
+        _ndjson_event('{"key00": "value00"}\n["value10"]\n'), {}
+    )
+    assert post_event_response == {
+        "statusCode": 400,
+        "body": '{"message": "Line 2 does not conform to the given schema"}',
+    }
+
+
+def test_post_events_body_too_large(
+    metadata_api, mock_auth, mock_stream_name, monkeypatch
+):
+    monkeypatch.setattr(handler, "max_body_bytes", 10)
+    post_event_response = handler.post_events(post_event_data.event_with_list, {})
+    assert post_event_response["statusCode"] == 413
+
+
 @mock_kinesis
 def test_post_single_event(metadata_api, mock_auth, mock_stream_name):
     stream_name = post_event_data.stream_name
@@ -75,12 +500,31 @@ def test_post_events_failed_records(
     assert post_event_response == expected_response
 
 
-def test_post_events_not_found(metadata_api, mock_auth):
+def test_post_events_not_found(metadata_api, mock_auth, mock_stream_name):
+    post_event_response = handler.post_events(post_event_data.event_not_found, {})
+    assert post_event_response == post_event_data.not_found_response
+
+
+def test_post_events_not_found_does_not_wait_for_auth(
+    metadata_api, mock_stream_name, monkeypatch
+):
+    auth_done = threading.Event()
+
+    def has_access(self, access_token, scope, resource_name):
+        auth_done.wait(5)
+        return True
+
+    monkeypatch.setattr(ResourceAuthorizer, "has_access", has_access)
+
+    start = time.monotonic()
     post_event_response = handler.post_events(post_event_data.event_not_found, {})
+    auth_done.set()
+
     assert post_event_response == post_event_data.not_found_response
+    assert time.monotonic() - start < 1
 
 
-def test_post_events_metadata_server_error(metadata_api, mock_auth):
+def test_post_events_metadata_server_error(metadata_api, mock_auth, mock_stream_name):
     post_event_response = handler.post_events(post_event_data.event_server_error, {})
     assert post_event_response == post_event_data.error_response
 
@@ -93,12 +537,12 @@ def test_post_events_client_error(metadata_api, mock_auth, mock_stream_name):
     assert post_event_response == post_event_data.error_response
 
 
-def test_post_events_decode_error(metadata_api, mock_auth):
+def test_post_events_decode_error(metadata_api, mock_auth, mock_stream_name):
     post_event_response = handler.post_events(post_event_data.decode_error_event, {})
     assert post_event_response == post_event_data.decode_error_response
 
 
-def test_post_events_validation_error(metadata_api, mock_auth):
+def test_post_events_validation_error(metadata_api, mock_auth, mock_stream_name):
     post_event_response_1 = handler.post_events(
         post_event_data.validation_error_event_1, {}
     )
@@ -109,10 +553,248 @@ def test_post_events_validation_error(metadata_api, mock_auth):
     assert post_event_response_2 == post_event_data.validation_error_response
 
 
-def test_post_events_forbidden(metadata_api, mock_auth):
+def test_post_events_dataset_schema_validation_error(
+    requests_mock, mock_auth, mock_stream_name
+):
+    handler.get_metadata_api_client().cache.clear()
+    requests_mock.register_uri(
+        "GET",
+        f"{handler.get_metadata_api_client().url}/datasets/{post_event_data.dataset_id}",
+        text=json.dumps(
+            {
+                "Id": post_event_data.dataset_id,
+                "accessRights": post_event_data.access_rights,
+                "_embedded": {
+                    "versions": [
+                        {
+                            "version": post_event_data.version,
+                            "schema": {"type": "object", "required": ["id"]},
+                        }
+                    ]
+                },
+            }
+        ),
+        status_code=200,
+    )
+    post_event_response = handler.post_events(post_event_data.event_with_list, {})
+    assert post_event_response == post_event_data.validation_error_response
+
+
+def test_post_events_forbidden(metadata_api, mock_auth, mock_stream_name):
+
+    response = handler.post_events(post_event_data.event_access_denied, {})
+    assert response == post_event_data.forbidden_response
+
+
+def test_forbidden_bodies_are_not_decoded(
+    metadata_api, mock_auth, mock_stream_name, monkeypatch
+):
+    decoded = []
+    monkeypatch.setattr(
+        handler, "decode_body", lambda *args: decoded.append(args) or "[]"
+    )
 
     response = handler.post_events(post_event_data.event_access_denied, {})
     assert response == post_event_data.forbidden_response
+    response = handler.events_webhook(post_event_data.webhook_event_access_denied, {})
+    assert response["statusCode"] == 403
+    assert decoded == []
+
+
+@mock_sqs
+@mock_kinesis
+def test_post_events_async_spooled(
+    metadata_api, mock_auth, mock_stream_name, async_stream, monkeypatch
+):
+    stream_name = post_event_data.stream_name
+    kinesis = create_event_stream(stream_name)
+    queue_url = create_spool_queue()
+    monkeypatch.setattr(handler, "spool_queue_url", queue_url)
+
+    post_event_response = handler.post_events(post_event_data.event_with_list, {})
+
+    assert post_event_response["statusCode"] == 202
+    messages = receive_spool_messages(queue_url)
+    assert len(messages) == 1
+
+    flush_response = handler.flush_spool({"Records": messages}, {})
+
+    assert flush_response == {"batchItemFailures": []}
+    shard_iterator = kinesis.get_shard_iterator(
+        StreamName=stream_name,
+        ShardId="shardId-000000000000",
+        ShardIteratorType="TRIM_HORIZON",
+    )["ShardIterator"]
+    records = kinesis.get_records(ShardIterator=shard_iterator)["Records"]
+    assert [json.loads(r["Data"]) for r in records] == json.loads(
+        post_event_data.event_with_list["body"]
+    )
+
+
+@mock_kinesis
+def test_post_events_async_without_spool(
+    metadata_api, mock_auth, mock_stream_name, async_stream, monkeypatch
+):
+    create_event_stream(post_event_data.stream_name)
+    monkeypatch.setattr(handler, "spool_queue_url", None)
+
+    post_event_response = handler.post_events(post_event_data.event_with_list, {})
+
+    assert post_event_response["statusCode"] == 200
+
+
+def test_flush_spool_failed_records(monkeypatch):
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        return "", [r for r in record_list if r["Data"] == "2\n"]
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    record_lists = [
+        [
+            {"Data": f"{i}\n", "PartitionKey": "k"},
+            {"Data": f"{i + 1}\n", "PartitionKey": "k"},
+        ]
+        for i in range(0, 6, 2)
+    ]
+    event = {
+        "Records": [
+            {
+                "messageId": f"m{i}",
+                "body": spool.encode_message(
+                    "stream", [spool.encode_record(r) for r in record_list]
+                ),
+            }
+            for i, record_list in enumerate(record_lists)
+        ]
+    }
+
+    assert handler.flush_spool(event, {}) == {
+        "batchItemFailures": [{"itemIdentifier": "m1"}]
+    }
+
+
+def test_post_events_idempotency_key(
+    metadata_api, mock_auth, mock_stream_name, idempotency_store, monkeypatch
+):
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        # The first attempt fails for the second event only
+        if len(put_record_lists) == 1:
+            return "", record_list[1:2]
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+    elements = [{"seq": i} for i in range(3)]
+    event = {
+        **post_event_data.event_with_list,
+        "headers": {
+            **post_event_data.event_with_list["headers"],
+            "Idempotency-Key": "batch-1",
+        },
+        "body": json.dumps(elements),
+    }
+
+    response = handler.post_events(event, {})
+    assert response["statusCode"] == 500
+    assert json.loads(response["body"])["failedElements"] == [{"seq": 1}]
+
+    # Resending the batch only puts the event that failed.
+    assert handler.post_events(event, {})["statusCode"] == 200
+    assert [json.loads(r["Data"]) for r in put_record_lists[1]] == [{"seq": 1}]
+
+    assert handler.post_events(event, {})["statusCode"] == 200
+    assert len(put_record_lists) == 2
+
+
+def test_events_webhook_idempotency_key_reused(
+    metadata_api, mock_auth, mock_stream_name, idempotency_store, monkeypatch
+):
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+
+    def post(elements, token="webhook-token"):
+        event = {
+            "pathParameters": {
+                "datasetId": post_event_data.dataset_id,
+                "version": post_event_data.version,
+            },
+            "queryStringParameters": {"token": token},
+            "headers": {"Idempotency-Key": "batch-1"},
+            "body": json.dumps(elements),
+        }
+        return handler.events_webhook(event, {})
+
+    assert post([{"seq": 0}])["statusCode"] == 200
+
+    # Different content under a known key is rejected rather than dropped.
+    response = post([{"seq": 1}])
+    assert response["statusCode"] == 422
+    assert post([{"seq": 0}, {"seq": 1}])["statusCode"] == 422
+
+    # Keys are scoped to the caller.
+    assert post([{"seq": 1}], token="other-webhook-token")["statusCode"] == 200
+    assert [[json.loads(r["Data"]) for r in rl] for rl in put_record_lists] == [
+        [{"seq": 0}],
+        [{"seq": 1}],
+    ]
+
+
+def test_post_events_idempotency_store_unavailable(
+    metadata_api, mock_auth, mock_stream_name, idempotency_store, monkeypatch
+):
+    def read_timeout(*args):
+        raise ReadTimeoutError(endpoint_url="https://dynamodb")
+
+    monkeypatch.setattr(idempotency_store, "seen", read_timeout)
+    monkeypatch.setattr(idempotency_store, "record", read_timeout)
+    monkeypatch.setattr(
+        handler, "put_records_to_kinesis", lambda *args, **kwargs: ("", [])
+    )
+    event = {
+        **post_event_data.event_with_list,
+        "headers": {
+            **post_event_data.event_with_list["headers"],
+            "Idempotency-Key": "batch-1",
+        },
+    }
+
+    # The events are put regardless, and the client isn't told to resend them.
+    assert handler.post_events(event, {}) == post_event_data.ok_response
+
+
+def test_post_events_idempotency_key_field(
+    metadata_api, mock_auth, mock_stream_name, idempotency_store, monkeypatch
+):
+    monkeypatch.setattr(
+        handler,
+        "get_stream_options",
+        lambda dataset_id, version: stream_options({"idempotency_key_field": "id"}),
+    )
+    put_record_lists = []
+
+    def put_records_to_kinesis(record_list, stream_name, retries, deadline=None):
+        put_record_lists.append(record_list)
+        return "", []
+
+    monkeypatch.setattr(handler, "put_records_to_kinesis", put_records_to_kinesis)
+
+    def post(elements):
+        event = {**post_event_data.event_with_list, "body": json.dumps(elements)}
+        return handler.post_events(event, {})
+
+    assert post([{"id": "a"}, {"id": "b"}, {"id": "a"}])["statusCode"] == 200
+    assert post([{"id": "b"}, {"id": "c"}, {}])["statusCode"] == 200
+
+    assert [[json.loads(r["Data"]) for r in rl] for rl in put_record_lists] == [
+        [{"id": "a"}, {"id": "b"}],
+        [{"id": "c"}, {}],
+    ]
 
 
 def test_extract_event_body():
@@ -127,7 +809,7 @@ def test_extract_event_body():
     assert event_body_2 == extract_event_body_test_data.expected_event_body
 
 
-def test_post_events_webhook_auth_forbidden(metadata_api, mock_auth):
+def test_post_events_webhook_auth_forbidden(metadata_api, mock_auth, mock_stream_name):
     forbidden_response = handler.events_webhook(
         post_event_data.webhook_event_access_denied, {}
     )
@@ -135,6 +817,37 @@ def test_post_events_webhook_auth_forbidden(metadata_api, mock_auth):
     assert forbidden_response["body"] == '{"message": "Forbidden"}'
 
 
+def test_post_events_warmup(metadata_api, mock_dynamodb, monkeypatch):
+    dataset_id, version = post_event_data.dataset_id, post_event_data.version
+    create_event_streams_table(
+        [
+            {"id": f"{dataset_id}/{version}", "config_version": 1},
+            {"id": f"{post_event_data.dataset_id_server_error}/1", "config_version": 1},
+        ]
+    )
+    monkeypatch.setattr(handler, "warmup_datasets", [(dataset_id, version)])
+    monkeypatch.setattr(handler, "warmup_recent_event_streams", 10)
+    metadata_api_client = handler.get_metadata_api_client()
+
+    response = handler.post_events(
+        {"source": "aws.events", "detail-type": "Scheduled Event"}, {}
+    )
+
+    assert response["statusCode"] == 200
+    assert metadata_api_client.cache.get(dataset_id)["Id"] == dataset_id
+    assert handler.event_stream_registry.cache.get(f"{dataset_id}/{version}") == {
+        "id": f"{dataset_id}/{version}",
+        "config_version": 1,
+    }
+
+
+def test_events_webhook_warmup(metadata_api, mock_dynamodb, monkeypatch):
+    monkeypatch.setattr(handler, "warmup_datasets", [])
+    monkeypatch.setattr(handler, "warmup_recent_event_streams", 0)
+
+    assert handler.events_webhook({"warmup": True}, {})["statusCode"] == 200
+
+
 def test_stream_name_identification(mock_dynamodb):
     table = create_event_streams_table()
     stream_name = handler.identify_stream_name(
@@ -150,6 +863,15 @@ def test_stream_name_identification(mock_dynamodb):
             "config_version": 2,
         }
     )
+    # The previous lookup is cached until the registry TTL runs out.
+    stream_name = handler.identify_stream_name(
+        post_event_data.dataset_id,
+        post_event_data.version,
+        post_event_data.confidentiality,
+    )
+    assert stream_name == post_event_data.stream_name
+
+    handler.event_stream_registry.clear()
     stream_name = handler.identify_stream_name(
         post_event_data.dataset_id,
         post_event_data.version,
@@ -158,12 +880,28 @@ def test_stream_name_identification(mock_dynamodb):
     assert stream_name == post_event_data.stream_name_raw
 
 
+def test_get_event_stream_current_config_version(mock_dynamodb):
+    event_stream_id = f"{post_event_data.dataset_id}/{post_event_data.version}"
+    create_event_streams_table(
+        [
+            {"id": event_stream_id, "config_version": 1},
+            {"id": event_stream_id, "config_version": 3},
+            {"id": event_stream_id, "config_version": 2},
+        ]
+    )
+    event_stream = handler.get_event_stream(event_stream_id)
+    assert event_stream["config_version"] == 3
+
+
 @pytest.fixture()
 def metadata_api(requests_mock):
+    handler.get_metadata_api_client().cache.clear()
+    handler.get_metadata_api_client().stale_cache.clear()
+    handler.get_metadata_api_client().breaker.record_success()
 
     requests_mock.register_uri(
         "GET",
-        f"{handler.metadata_api_client.url}/datasets/{post_event_data.dataset_id}",
+        f"{handler.get_metadata_api_client().url}/datasets/{post_event_data.dataset_id}",
         text=json.dumps(
             {
                 "Id": post_event_data.dataset_id,
@@ -176,14 +914,14 @@ def metadata_api(requests_mock):
 
     requests_mock.register_uri(
         "GET",
-        f"{handler.metadata_api_client.url}/datasets/{post_event_data.dataset_id_not_found}",
+        f"{handler.get_metadata_api_client().url}/datasets/{post_event_data.dataset_id_not_found}",
         text=json.dumps({"message": "Not Found"}),
         status_code=404,
     )
 
     requests_mock.register_uri(
         "GET",
-        f"{handler.metadata_api_client.url}/datasets/{post_event_data.dataset_id_server_error}",
+        f"{handler.get_metadata_api_client().url}/datasets/{post_event_data.dataset_id_server_error}",
         text=json.dumps({"message": "Server Error"}),
         status_code=500,
     )
@@ -191,6 +929,9 @@ def metadata_api(requests_mock):
 
 @pytest.fixture()
 def mock_auth(monkeypatch):
+    handler.get_resource_authorizer().cache.clear()
+    handler.get_webhook_client().cache.clear()
+
     def authorize_webhook_token(self, dataset_id, token, operation, retries):
         if token == post_event_data.webhook_token_access_denied or operation != "write":
             return {"access": False, "reason": "Forbidden"}
@@ -213,7 +954,7 @@ def mock_auth(monkeypatch):
 
 @pytest.fixture()
 def failed_records(monkeypatch):
-    def failed_records(record_list, stream_name, retries):
+    def failed_records(record_list, stream_name, retries, deadline=None):
         return "", post_event_data.failed_record_list
 
     monkeypatch.setattr(handler, "put_records_to_kinesis", failed_records)
@@ -225,8 +966,28 @@ def mock_stream_name(monkeypatch):
         return f"dp.{confidentiality}.{dataset_id}.incoming.{version}.json"
 
     monkeypatch.setattr(handler, "identify_stream_name", identify_stream_name)
+    monkeypatch.setattr(
+        handler, "get_stream_options", lambda dataset_id, version: stream_options(None)
+    )
+
+
+@pytest.fixture()
+def async_stream(monkeypatch):
+    monkeypatch.setattr(
+        handler,
+        "get_stream_options",
+        lambda dataset_id, version: stream_options({"delivery_mode": "async"}),
+    )
+
+
+@pytest.fixture()
+def idempotency_store():
+    handler.get_idempotency_store().cache.clear()
+    yield handler.get_idempotency_store()
+    handler.get_idempotency_store().cache.clear()
 
 
 @pytest.fixture(scope="function")
 def mock_dynamodb():
+    handler.event_stream_registry.clear()
     mock_dynamodb2().start()
@@ -0,0 +1,85 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from event_collector.http_session import connection_stats, create_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        statuses = self.server.statuses
+        status = statuses.pop(0) if statuses else 200
+        self.server.requests += 1
+        self.send_response(status)
+        if status != 200 and self.server.retry_after:
+            self.send_header("Retry-After", self.server.retry_after)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.statuses = []
+    server.requests = 0
+    server.retry_after = None
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_port}/datasets/d123"
+
+
+def test_connections_are_reused(server):
+    session = create_session()
+    for _ in range(3):
+        assert session.get(_url(server), timeout=(1, 1)).status_code == 200
+
+    assert connection_stats(session) == {"connections": 1, "requests": 3}
+
+
+def test_retries_server_errors(server):
+    server.statuses = [503, 502]
+    session = create_session(retries=2, backoff_factor=0)
+
+    assert session.get(_url(server), timeout=(1, 1)).status_code == 200
+    assert server.requests == 3
+
+
+def test_returns_last_response_when_out_of_retries(server):
+    server.statuses = [503, 503, 503]
+    session = create_session(retries=1, backoff_factor=0)
+
+    assert session.get(_url(server), timeout=(1, 1)).status_code == 503
+    assert server.requests == 2
+
+
+def test_ignores_retry_after(server):
+    server.statuses = [503]
+    server.retry_after = "10"
+    session = create_session(retries=2, backoff_factor=0)
+
+    start = time.monotonic()
+    assert session.get(_url(server), timeout=(1, 1)).status_code == 200
+    assert time.monotonic() - start < 1
+    assert server.requests == 2
+
+
+def test_does_not_retry_other_errors(server):
+    server.statuses = [500]
+    session = create_session(retries=2, backoff_factor=0)
+
+    assert session.get(_url(server), timeout=(1, 1)).status_code == 500
+    assert server.requests == 1
@@ -0,0 +1,146 @@
+import boto3
+from moto import mock_dynamodb2
+
+import pytest
+
+from event_collector.idempotency import (
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    check_content,
+    event_keys,
+)
+
+TABLE_NAME = "event-collector-idempotency"
+
+
+def _events(elements):
+    return [(element, f"{element}\n") for element in elements]
+
+
+def create_idempotency_table(region="eu-west-1"):
+    client = boto3.client("dynamodb", region_name=region)
+    client.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "key", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "key", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return client
+
+
+def test_event_keys_field():
+    events = _events([{"id": "a"}, {"id": "b"}, {"id": "a"}, {"other": 1}])
+    keys = event_keys(events, "d123/1", key_field="id")
+
+    assert keys[0] == keys[2]
+    assert keys[0] != keys[1]
+    assert keys[0][1] is None
+    assert keys[3] == (None, None)
+    assert event_keys(events, "d456/1", key_field="id")[0] != keys[0]
+
+
+def test_event_keys_header():
+    events = _events([{"id": "a"}, {"id": "a"}])
+    keys = event_keys(events, "d123/1", idempotency_key="batch-1")
+
+    assert keys[0] != keys[1]
+    assert keys == event_keys(events, "d123/1", idempotency_key="batch-1")
+    assert keys != event_keys(events, "d123/1", idempotency_key="batch-2")
+    assert event_keys(events, "d123/1") == [(None, None), (None, None)]
+
+
+def test_event_keys_header_caller():
+    events = _events([{"id": "a"}])
+    keys = event_keys(events, "d123/1", idempotency_key="batch-1", caller="alice")
+
+    assert keys != event_keys(events, "d123/1", idempotency_key="batch-1", caller="bob")
+
+
+def test_event_keys_header_content_hash():
+    [(key, content_hash)] = event_keys(
+        _events([{"id": "a"}]), "d123/1", idempotency_key="batch-1"
+    )
+    [(other_key, other_hash), _] = event_keys(
+        _events([{"id": "b"}, {"id": "c"}]), "d123/1", idempotency_key="batch-1"
+    )
+
+    assert other_key == key
+    assert other_hash != content_hash
+    check_content(key, content_hash, content_hash)
+    check_content(key, content_hash, None)
+    with pytest.raises(IdempotencyKeyReused):
+        check_content(key, other_hash, content_hash)
+
+
+def test_event_keys_field_before_header():
+    events = _events([{"id": "a"}, {}])
+    keys = event_keys(events, "d123/1", key_field="id", idempotency_key="batch-1")
+
+    assert keys[0] == event_keys(events, "d123/1", key_field="id")[0]
+    assert keys[1] == event_keys(events, "d123/1", idempotency_key="batch-1")[1]
+
+
+def test_idempotency_store_in_process():
+    store = IdempotencyStore(maxsize=2)
+    store.record({"a": None, "b": "hash-b"})
+
+    assert store.seen(["a", "b", "c"]) == {"a": None, "b": "hash-b"}
+
+    store.record({"c": None})
+    assert store.seen(["a", "b", "c"]) == {"b": "hash-b", "c": None}
+
+
+@mock_dynamodb2
+def test_idempotency_store_dynamodb():
+    client = create_idempotency_table()
+    IdempotencyStore(client, TABLE_NAME).record(
+        {f"key{i}": f"hash{i}" if i % 2 else None for i in range(150)}
+    )
+
+    # A fresh store (e.g. in another container) finds them in the table.
+    store = IdempotencyStore(client, TABLE_NAME)
+    assert store.seen(["key0", "key149", "other"]) == {
+        "key0": None,
+        "key149": "hash149",
+    }
+    assert len(store.cache) == 2
+
+
+@mock_dynamodb2
+def test_idempotency_store_dynamodb_expired():
+    client = create_idempotency_table()
+    now = 1_600_000_000
+    IdempotencyStore(client, TABLE_NAME, ttl=60, clock=lambda: now).record({"a": None})
+
+    store = IdempotencyStore(client, TABLE_NAME, ttl=60, clock=lambda: now + 61)
+    assert store.seen(["a"]) == {}
+
+
+def test_idempotency_store_throttled_table():
+    class ThrottledClient:
+        def __init__(self):
+            self.calls = 0
+
+        def batch_write_item(self, RequestItems):
+            self.calls += 1
+            return {"UnprocessedItems": RequestItems}
+
+        def batch_get_item(self, RequestItems):
+            self.calls += 1
+            return {"Responses": {}, "UnprocessedKeys": RequestItems}
+
+    client = ThrottledClient()
+    sleeps = []
+    store = IdempotencyStore(client, TABLE_NAME, max_attempts=3, sleep=sleeps.append)
+
+    store.record({"a": None})
+    assert client.calls == 3
+    assert len(sleeps) == 2
+
+    assert (
+        IdempotencyStore(client, TABLE_NAME, max_attempts=3, sleep=sleeps.append).seen(
+            ["a"]
+        )
+        == {}
+    )
+    assert client.calls == 6
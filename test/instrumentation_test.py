@@ -0,0 +1,107 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from event_collector import instrumentation
+
+
+def test_instrumented(monkeypatch, capsys):
+    flushed = []
+    monkeypatch.setattr(
+        instrumentation, "_log_add", lambda **kwargs: flushed.append(kwargs)
+    )
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        instrumentation.log_add(a=1)
+        instrumentation.log_add(a=2, b="b")
+        instrumentation.log_incr(count=1)
+        instrumentation.log_incr(count=2)
+        instrumentation.log_duration(lambda: None, "duration")
+        return "response"
+
+    assert handler({}, {}) == "response"
+    assert len(flushed) == 1
+    assert flushed[0]["a"] == 2
+    assert flushed[0]["b"] == "b"
+    assert flushed[0]["count"] == 3
+    assert flushed[0]["duration"] >= 0
+    # No debug output by default
+    assert capsys.readouterr().out == ""
+
+
+def test_instrumented_debug_output(monkeypatch, capsys):
+    monkeypatch.setattr(instrumentation, "_log_add", lambda **kwargs: None)
+    monkeypatch.setattr(instrumentation, "debug_sample_rate", 1)
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        instrumentation.log_add(a=1)
+
+    handler({}, {})
+    assert "Adding log fields: {'a': 1}" in capsys.readouterr().out
+
+
+def test_instrumented_flushes_on_exception(monkeypatch):
+    flushed = []
+    monkeypatch.setattr(
+        instrumentation, "_log_add", lambda **kwargs: flushed.append(kwargs)
+    )
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        instrumentation.log_add(a=1)
+        raise ValueError
+
+    try:
+        handler({}, {})
+    except ValueError:
+        pass
+    assert flushed == [{"a": 1}]
+
+
+def test_submitted_work_logs_to_its_invocation(monkeypatch):
+    flushed = []
+    monkeypatch.setattr(
+        instrumentation, "_log_add", lambda **kwargs: flushed.append(kwargs)
+    )
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        instrumentation.submit(
+            executor, instrumentation.log_incr, count=event["count"]
+        ).result()
+
+    handler({"count": 1}, {})
+    handler({"count": 2}, {})
+    assert flushed == [{"count": 1}, {"count": 2}]
+
+
+def test_work_finishing_after_invocation_is_dropped(monkeypatch):
+    flushed = []
+    exceptions = []
+    monkeypatch.setattr(
+        instrumentation, "_log_add", lambda **kwargs: flushed.append(kwargs)
+    )
+    monkeypatch.setattr(instrumentation, "_log_exception", exceptions.append)
+    executor = ThreadPoolExecutor(max_workers=1)
+    invocation_ended = threading.Event()
+    futures = []
+
+    def leftover():
+        invocation_ended.wait()
+        instrumentation.log_add(leftover=True)
+        instrumentation.log_exception(ValueError())
+
+    @instrumentation.instrumented
+    def handler(event, context):
+        if event.get("first"):
+            futures.append(instrumentation.submit(executor, leftover))
+        instrumentation.log_add(a=1)
+
+    handler({"first": True}, {})
+    invocation_ended.set()
+    futures[0].result()
+    handler({}, {})
+    assert flushed == [{"a": 1}, {"a": 1}]
+    assert exceptions == []
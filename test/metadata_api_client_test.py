@@ -71,3 +71,193 @@ def test_version_exists_server_error(requests_mock):
 
     with pytest.raises(ServerErrorException):
         metadata_api_client.get_dataset_and_versions(dataset_id)
+
+
+def test_get_dataset_and_versions_cached(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL)
+
+    matcher = requests_mock.register_uri(
+        "GET",
+        f"{TEST_URL}/datasets/{dataset_id}",
+        text=json.dumps(dataset),
+        status_code=200,
+    )
+
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+    assert matcher.call_count == 1
+    assert metadata_api_client.cache.stats()["hits"] == 1
+
+
+def test_get_dataset_and_versions_not_found_cached(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL, not_found_ttl=0)
+
+    matcher = requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/{dataset_id}", text="Not found", status_code=404
+    )
+
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) is None
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) is None
+    # A zero TTL for missing datasets means that they're never served from
+    # the cache.
+    assert matcher.call_count == 2
+
+
+def test_get_dataset_and_versions_server_error_not_cached(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL)
+
+    matcher = requests_mock.register_uri(
+        "GET",
+        f"{TEST_URL}/datasets/{dataset_id}",
+        text=json.dumps({"message": "Server Error"}),
+        status_code=500,
+    )
+
+    for _ in range(2):
+        with pytest.raises(ServerErrorException):
+            metadata_api_client.get_dataset_and_versions(dataset_id)
+    assert matcher.call_count == 2
+
+
+def test_get_dataset_and_versions_invalid_json(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL)
+
+    requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/{dataset_id}", text="", status_code=200
+    )
+
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) is None
+
+
+def test_get_dataset_and_versions_serves_stale_on_server_error(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL, cache_ttl=0)
+    url = f"{TEST_URL}/datasets/{dataset_id}"
+
+    requests_mock.register_uri("GET", url, text=json.dumps(dataset))
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+
+    requests_mock.register_uri("GET", url, text="{}", status_code=503)
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+
+
+def test_get_dataset_and_versions_stale_window(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL, cache_ttl=0, stale_ttl=0)
+    url = f"{TEST_URL}/datasets/{dataset_id}"
+
+    requests_mock.register_uri("GET", url, text=json.dumps(dataset))
+    metadata_api_client.get_dataset_and_versions(dataset_id)
+
+    requests_mock.register_uri("GET", url, text="{}", status_code=503)
+    with pytest.raises(ServerErrorException):
+        metadata_api_client.get_dataset_and_versions(dataset_id)
+
+
+def test_get_dataset_and_versions_not_found_not_served_stale(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL, cache_ttl=0, not_found_ttl=0)
+    url = f"{TEST_URL}/datasets/{dataset_id}"
+
+    requests_mock.register_uri("GET", url, text=json.dumps(dataset))
+    metadata_api_client.get_dataset_and_versions(dataset_id)
+
+    requests_mock.register_uri("GET", url, text="{}", status_code=404)
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) is None
+
+    # The deleted dataset isn't brought back by an outage.
+    requests_mock.register_uri("GET", url, text="{}", status_code=503)
+    with pytest.raises(ServerErrorException):
+        metadata_api_client.get_dataset_and_versions(dataset_id)
+
+
+def test_get_dataset_and_versions_circuit_open(requests_mock):
+    metadata_api_client = MetadataApiClient(
+        TEST_URL, cache_ttl=0, failure_threshold=2, reset_timeout=60
+    )
+    good = requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/good", text=json.dumps(dataset)
+    )
+    bad = requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/bad", text="{}", status_code=500
+    )
+    metadata_api_client.get_dataset_and_versions("good")
+
+    for _ in range(3):
+        with pytest.raises(ServerErrorException):
+            metadata_api_client.get_dataset_and_versions("bad")
+    # The breaker opened after two failures, and is failing fast since.
+    assert bad.call_count == 2
+
+    # Known datasets are served from the stale cache without a request.
+    assert metadata_api_client.get_dataset_and_versions("good") == dataset
+    assert good.call_count == 1
+
+
+def test_get_dataset_and_versions_refreshes_in_background(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(
+        TEST_URL, cache_ttl=0, failure_threshold=1, reset_timeout=0
+    )
+    url = f"{TEST_URL}/datasets/{dataset_id}"
+    requests_mock.register_uri("GET", url, text=json.dumps(dataset))
+    metadata_api_client.get_dataset_and_versions(dataset_id)
+
+    requests_mock.register_uri("GET", url, text="{}", status_code=500)
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+    assert metadata_api_client.breaker.state != "closed"
+
+    updated_dataset = {**dataset, "title": "Updated"}
+    matcher = requests_mock.register_uri("GET", url, text=json.dumps(updated_dataset))
+    # Served stale while the breaker lets a trial request through in the
+    # background.
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+    metadata_api_client._refresh_executor.submit(lambda: None).result()
+
+    assert matcher.call_count == 1
+    assert metadata_api_client.breaker.state == "closed"
+    assert metadata_api_client.stale_cache.get(dataset_id) == updated_dataset
+
+
+def test_get_dataset_and_versions_timeout(requests_mock):
+    metadata_api_client = MetadataApiClient(
+        TEST_URL, connect_timeout=0.5, read_timeout=2
+    )
+    requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/d123", text=json.dumps(dataset)
+    )
+
+    metadata_api_client.get_dataset_and_versions("d123")
+
+    assert requests_mock.last_request.timeout == (0.5, 2)
+
+
+def test_get_dataset_and_versions_serves_stale_on_non_json_error(requests_mock):
+    dataset_id = "d123"
+    metadata_api_client = MetadataApiClient(TEST_URL, cache_ttl=0)
+    url = f"{TEST_URL}/datasets/{dataset_id}"
+
+    requests_mock.register_uri("GET", url, text=json.dumps(dataset))
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+
+    requests_mock.register_uri(
+        "GET", url, text="<html>502 Bad Gateway</html>", status_code=502
+    )
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+
+    requests_mock.register_uri("GET", url, text="", status_code=503)
+    assert metadata_api_client.get_dataset_and_versions(dataset_id) == dataset
+
+
+def test_get_dataset_and_versions_non_json_error(requests_mock):
+    metadata_api_client = MetadataApiClient(TEST_URL)
+    requests_mock.register_uri(
+        "GET", f"{TEST_URL}/datasets/d123", text="<html></html>", status_code=504
+    )
+
+    with pytest.raises(ServerErrorException):
+        metadata_api_client.get_dataset_and_versions("d123")
@@ -0,0 +1,76 @@
+import pytest
+
+from event_collector.partitioning import (
+    group_by_key,
+    interleave_by_key,
+    partition_key_function,
+    random_key,
+)
+
+
+def test_random_key():
+    keys = {random_key() for _ in range(1000)}
+    assert len(keys) == 1000
+    assert all(len(key) == 32 for key in keys)
+
+
+def test_partition_key_function_random():
+    assert partition_key_function(None) is None
+    assert partition_key_function("random", "ignored") is None
+
+
+def test_partition_key_function_invalid():
+    with pytest.raises(ValueError):
+        partition_key_function("field")
+    with pytest.raises(ValueError):
+        partition_key_function("sorted", "id")
+
+
+def test_partition_key_function_field():
+    partition_key = partition_key_function("field", "device.id")
+
+    assert partition_key({"device": {"id": "sensor-1"}}) == "sensor-1"
+    assert partition_key({"device": {"id": 42}}) == "42"
+    # Too long to be used as it is
+    assert len(partition_key({"device": {"id": "x" * 300}})) == 32
+    # Missing field
+    assert partition_key({"device": "sensor-1"}) != partition_key(
+        {"device": "sensor-1"}
+    )
+
+
+def test_partition_key_function_hash():
+    partition_key = partition_key_function("hash", "user")
+
+    key = partition_key({"user": "ola.nordmann@example.org"})
+    assert key == partition_key({"user": "ola.nordmann@example.org"})
+    assert key != partition_key({"user": "kari.nordmann@example.org"})
+    assert "nordmann" not in key
+
+
+def test_group_by_key():
+    events = [({"id": i % 2}, f"{i}\n") for i in range(5)]
+    assert group_by_key(events, partition_key_function("field", "id")) == [
+        ("0", ["0\n", "2\n", "4\n"]),
+        ("1", ["1\n", "3\n"]),
+    ]
+
+
+def test_interleave_by_key():
+    record_list = [
+        {"Data": "a1", "PartitionKey": "a"},
+        {"Data": "a2", "PartitionKey": "a"},
+        {"Data": "a3", "PartitionKey": "a"},
+        {"Data": "b1", "PartitionKey": "b"},
+        {"Data": "c1", "PartitionKey": "c"},
+        {"Data": "c2", "PartitionKey": "c"},
+    ]
+    assert [r["Data"] for r in interleave_by_key(record_list)] == [
+        "a1",
+        "b1",
+        "c1",
+        "a2",
+        "c2",
+        "a3",
+    ]
+    assert interleave_by_key([]) == []
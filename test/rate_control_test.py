@@ -0,0 +1,104 @@
+from event_collector.rate_control import (
+    RateController,
+    RateControllerRegistry,
+    throttled_count,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_throttled_count():
+    assert throttled_count({"FailedRecordCount": 0, "Records": [{}]}) == 0
+    assert (
+        throttled_count(
+            {
+                "FailedRecordCount": 3,
+                "Records": [
+                    {"ErrorCode": "ProvisionedThroughputExceededException"},
+                    {},
+                    {"ErrorCode": "InternalFailure"},
+                    {"ErrorCode": "ProvisionedThroughputExceededException"},
+                ],
+            }
+        )
+        == 2
+    )
+
+
+def test_rate_controller_decrease():
+    controller = RateController(max_rate=1000, min_rate=100, max_concurrency=4)
+
+    controller.update(100, 50)
+    assert controller.stats() == {"rate": 500, "concurrency": 2}
+
+    for _ in range(5):
+        controller.update(100, 50)
+    assert controller.stats() == {"rate": 100, "concurrency": 1}
+
+
+def test_rate_controller_ignores_low_throttle_rates():
+    controller = RateController(max_rate=1000, throttle_threshold=0.05)
+    controller.update(100, 1)
+    assert controller.rate == 1000
+
+
+def test_rate_controller_increase():
+    controller = RateController(max_rate=1000, increase=100, max_concurrency=4)
+    controller.update(100, 100)
+    controller.update(100, 100)
+    assert controller.stats() == {"rate": 250, "concurrency": 1}
+
+    controller.update(100, 0)
+    assert controller.stats() == {"rate": 350, "concurrency": 2}
+
+    for _ in range(10):
+        controller.update(100, 0)
+    assert controller.stats() == {"rate": 1000, "concurrency": 4}
+
+
+def test_rate_controller_reserve():
+    clock = FakeClock()
+    controller = RateController(max_rate=100, burst=1.0, clock=clock)
+
+    # A full bucket lets a burst through right away
+    assert controller.reserve(100) == 0
+    assert controller.reserve(50) == 0.5
+
+    clock.now = 1.5
+    assert controller.reserve(100) == 0
+
+
+def test_rate_controller_release():
+    clock = FakeClock()
+    controller = RateController(max_rate=100, burst=1.0, clock=clock)
+    controller.reserve(100)
+
+    assert controller.reserve(100) == 1
+    controller.release(100)
+    assert controller.reserve(50) == 0.5
+
+
+def test_rate_controller_reserve_after_decrease():
+    clock = FakeClock()
+    controller = RateController(max_rate=100, min_rate=1, burst=1.0, clock=clock)
+    controller.update(10, 10)
+
+    assert controller.reserve(100) == 1
+
+
+def test_rate_controller_registry():
+    registry = RateControllerRegistry(max_rate=100)
+    controller = registry.get("stream")
+
+    assert registry.get("stream") is controller
+    assert registry.get("other") is not controller
+    assert controller.max_rate == 100
+
+    registry.clear()
+    assert registry.get("stream") is not controller
@@ -0,0 +1,29 @@
+import math
+
+from event_collector.retry import Deadline, backoff_delay
+
+
+class LambdaContext:
+    def __init__(self, remaining_time_in_millis):
+        self.remaining_time_in_millis = remaining_time_in_millis
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_time_in_millis
+
+
+def test_backoff_delay():
+    for attempt in range(10):
+        delay = backoff_delay(attempt, base=0.1, cap=1.0)
+        assert 0 <= delay <= min(1.0, 0.1 * 2**attempt)
+
+
+def test_deadline_from_context():
+    deadline = Deadline.from_context(LambdaContext(10000), margin=2)
+    assert 7.5 < deadline.remaining() <= 8
+
+    deadline = Deadline.from_context(LambdaContext(1000), margin=2)
+    assert deadline.remaining() == 0
+
+
+def test_deadline_without_context():
+    assert Deadline.from_context({}).remaining() == math.inf
@@ -0,0 +1,55 @@
+import json
+from json import JSONDecodeError
+
+import pytest
+
+from event_collector.splitter import split_events, split_lines
+
+
+def test_split_events_array():
+    body = '[{"a": 1},{"b": [1, 2]} , {"c": "æ"}]'
+    assert list(split_events(body)) == [
+        ({"a": 1}, '{"a": 1}\n'),
+        ({"b": [1, 2]}, '{"b": [1, 2]}\n'),
+        ({"c": "æ"}, '{"c": "æ"}\n'),
+    ]
+
+
+def test_split_events_single_object():
+    assert list(split_events(' {"a": 1} ')) == [({"a": 1}, '{"a": 1}\n')]
+
+
+def test_split_events_empty_array():
+    assert list(split_events(" [ ] ")) == []
+
+
+def test_split_events_multiline_element():
+    body = json.dumps([{"a": 1, "b": 2}], indent=2)
+    assert list(split_events(body)) == [({"a": 1, "b": 2}, '{"a": 1, "b": 2}\n')]
+
+
+def test_split_events_scalars():
+    assert list(split_events('[1, "a"]')) == [(1, "1\n"), ("a", '"a"\n')]
+
+
+@pytest.mark.parametrize(
+    "body",
+    ["", "[", "[{}", "[{},]", "[{} {}]", "{} {}", "[{}]]", "not json", "[{]"],
+)
+def test_split_events_invalid(body):
+    with pytest.raises(JSONDecodeError):
+        list(split_events(body))
+
+
+def test_split_lines():
+    body = '{"a": 1}\n\n  \r\n{"b": 2}\r\n{"c": 3}'
+    assert list(split_lines(body)) == [
+        (1, '{"a": 1}'),
+        (4, '{"b": 2}'),
+        (5, '{"c": 3}'),
+    ]
+
+
+def test_split_lines_trailing_newline():
+    assert list(split_lines('{"a": 1}\n')) == [(1, '{"a": 1}')]
+    assert list(split_lines("")) == []
@@ -0,0 +1,105 @@
+import json
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_sqs
+
+import event_collector.aws_clients as aws_clients
+import event_collector.spool as spool
+from event_collector.spool import (
+    batch_messages,
+    decode_message,
+    encode_message,
+    encode_record,
+    pack_messages,
+    spool_records,
+)
+
+
+@pytest.fixture(autouse=True)
+def aws_clients_reset():
+    aws_clients.reset()
+    yield
+    aws_clients.reset()
+
+
+def _record(data, partition_key="aa-bb"):
+    return {"Data": data, "PartitionKey": partition_key}
+
+
+def test_encode_decode_message():
+    record_list = [_record('{"a": 1}\n'), _record(b"\x1f\x8b\x00", "cc")]
+    body = encode_message("stream", [encode_record(r) for r in record_list])
+
+    assert json.loads(body)["records"][1]["encoding"] == "base64"
+    assert decode_message(body) == ("stream", record_list)
+
+
+def test_pack_messages():
+    record_list = [_record("x" * 100) for _ in range(30)]
+    messages, oversized_records = pack_messages("stream", record_list, 2048)
+
+    assert len(messages) > 1
+    assert [r for _, records in messages for r in records] == record_list
+    assert all(len(body) <= 2048 for body, _ in messages)
+    assert decode_message(messages[0][0]) == ("stream", messages[0][1])
+    assert oversized_records == []
+
+
+def test_pack_messages_oversized():
+    small = _record("x")
+    large = _record("x" * 2048)
+    messages, oversized_records = pack_messages("stream", [small, large], 2048)
+
+    assert [records for _, records in messages] == [[small]]
+    assert oversized_records == [large]
+
+
+def test_batch_messages():
+    messages = [("x" * 1000, []) for _ in range(25)] + [("x" * 260 * 1024, [])]
+    assert [len(batch) for batch in batch_messages(messages)] == [10, 10, 5, 1]
+
+
+@mock_sqs
+def test_spool_records():
+    sqs = boto3.client("sqs", region_name="eu-west-1")
+    queue_url = sqs.create_queue(QueueName="spool")["QueueUrl"]
+    record_list = [_record(f"{i}\n") for i in range(100)] + [_record("x" * 300000)]
+
+    unspooled_records = spool_records(queue_url, "stream", record_list)
+
+    assert unspooled_records == record_list[-1:]
+    messages = sqs.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)
+    assert len(messages["Messages"]) == 1
+    assert decode_message(messages["Messages"][0]["Body"]) == (
+        "stream",
+        record_list[:-1],
+    )
+
+
+def test_spool_records_client_error(monkeypatch):
+    class FailingSQSClient:
+        calls = 0
+
+        def send_message_batch(self, QueueUrl, Entries):
+            self.calls += 1
+            if self.calls == 2:
+                raise ClientError(
+                    {"Error": {"Code": "InternalError"}}, "SendMessageBatch"
+                )
+            return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+    monkeypatch.setattr(spool, "get_client", lambda service: FailingSQSClient())
+    record_list = [_record("x" * 100 * 1024) for _ in range(30)]
+
+    unspooled_records = spool_records("queue-url", "stream", record_list)
+
+    # The first batch was spooled, and the rest is given back to the caller.
+    sent_records = [
+        r
+        for _, records in batch_messages(pack_messages("stream", record_list)[0])[0]
+        for r in records
+    ]
+    assert sent_records
+    assert unspooled_records == record_list[len(sent_records) :]
@@ -7,6 +7,21 @@ def create_event_stream(stream_name, region="eu-west-1"):
     return conn
 
 
+def create_spool_queue(region="eu-west-1"):
+    conn = boto3.client("sqs", region_name=region)
+    return conn.create_queue(QueueName="event-collector-spool")["QueueUrl"]
+
+
+def receive_spool_messages(queue_url, region="eu-west-1"):
+    """Return spool messages shaped like the records of an SQS Lambda event."""
+    conn = boto3.client("sqs", region_name=region)
+    response = conn.receive_message(QueueUrl=queue_url, MaxNumberOfMessages=10)
+    return [
+        {"messageId": message["MessageId"], "body": message["Body"]}
+        for message in response.get("Messages", [])
+    ]
+
+
 def create_event_streams_table(item_list=[], region="eu-west-1"):
     table_name = "event-streams"
     client = boto3.client("dynamodb", region_name=region)
@@ -0,0 +1,57 @@
+import pytest
+from jsonschema import ValidationError
+
+from event_collector import validation
+
+
+def _dataset(schema=None):
+    version = {"version": "1"}
+    if schema:
+        version["schema"] = schema
+    return {"Id": "d123", "_embedded": {"versions": [version]}}
+
+
+def test_validate_events():
+    validation.validate_events([{"key": "value"}, {}])
+    validation.validate_events([])
+
+    with pytest.raises(ValidationError):
+        validation.validate_events([{"key": "value"}, "value"])
+    with pytest.raises(ValidationError):
+        validation.validate_events({"key": "value"})
+
+
+def test_post_events_validator_compiled_once():
+    assert validation.post_events_validator() is validation.post_events_validator()
+
+
+def test_get_item_validator():
+    validation.item_validators.clear()
+    schema = {"type": "object", "required": ["id"]}
+
+    validator = validation.get_item_validator(_dataset(schema), "1")
+    validator.validate({"id": 1})
+    with pytest.raises(ValidationError):
+        validator.validate({})
+
+    assert validation.get_item_validator(_dataset(schema), "1") is validator
+    assert validation.get_item_validator(_dataset(), "1") is None
+    assert validation.get_item_validator(_dataset(schema), "2") is None
+
+
+def test_get_item_validator_schema_changed():
+    validation.item_validators.clear()
+    validator = validation.get_item_validator(_dataset({"type": "object"}), "1")
+    changed = validation.get_item_validator(
+        _dataset({"type": "object", "required": ["id"]}), "1"
+    )
+    assert changed is not validator
+
+
+def test_validate_event():
+    validation.validate_event({"key": "value"})
+
+    with pytest.raises(ValidationError):
+        validation.validate_event("value")
+    with pytest.raises(ValidationError):
+        validation.validate_event([{"key": "value"}])
@@ -0,0 +1,61 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from event_collector.warmup import (
+    is_warmup_event,
+    parse_datasets,
+    recent_datasets,
+    run,
+)
+
+
+def test_is_warmup_event():
+    assert is_warmup_event({"warmup": True})
+    assert is_warmup_event({"source": "aws.events", "detail-type": "Scheduled Event"})
+    assert not is_warmup_event({"source": "aws.events", "detail-type": "Other"})
+    assert not is_warmup_event({"httpMethod": "POST", "warmup": True, "body": "{}"})
+    assert not is_warmup_event({"httpMethod": "POST", "body": "{}"})
+
+
+def test_parse_datasets():
+    assert parse_datasets("") == []
+    assert parse_datasets("d1/1, d2/2,,d3") == [("d1", "1"), ("d2", "2"), ("d3", None)]
+
+
+def test_recent_datasets():
+    items = [
+        {"id": "d1/1", "config_version": 1, "updated_at": "2021-01-01T00:00:00"},
+        {"id": "d2/1", "config_version": 1, "create_time": "2021-03-01T00:00:00"},
+        {"id": "d3/1", "config_version": 1, "updated_at": "2021-02-01T00:00:00"},
+        {"id": "d1/1", "config_version": 2, "updated_at": "2021-04-01T00:00:00"},
+        {"id": "d4/1", "config_version": 1, "updated_at": "2021-05-01T00:00:00"},
+        {"id": "d4/1", "config_version": 2, "deleted": True},
+        {"id": "d5", "config_version": 1},
+    ]
+
+    assert recent_datasets(items, 2) == [("d1", "1"), ("d2", "1")]
+    assert recent_datasets(items, 10)[-1] == ("d5", None)
+
+
+def test_run():
+    def fail():
+        raise Exception("Failed")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert run([lambda: None, fail, lambda: None], executor, timeout=1) == 2
+
+
+def test_run_cancels_pending_tasks():
+    release = threading.Event()
+    started = []
+
+    def task():
+        started.append(True)
+        release.wait()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        assert run([task, task, task], executor, timeout=0.05) == 0
+        release.set()
+
+    # Only the task already running when the timeout passed was run.
+    assert len(started) == 1